@@ -0,0 +1,135 @@
+"""Cold import times of the entry points, to catch startup regressions.
+
+Every module is imported in a fresh interpreter with -X importtime, so nothing is cached between runs.
+The report holds the median total import time of each module and the slowest modules it pulls in.
+
+Usage:
+    python benchmark_imports.py run --output baseline.json
+    python benchmark_imports.py run --compare baseline.json
+    python benchmark_imports.py compare baseline.json current.json --threshold 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+
+MODULES = ["overlay_configuration", "custom_controls", "overlay_controller", "overlay"]
+TOP_IMPORTS = 10
+
+
+def parse_importtime(stderr):
+    """Return {module: (self µs, cumulative µs)} from -X importtime output."""
+    imports = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        imports[name.strip()] = (int(self_us), int(cumulative_us))
+    return imports
+
+
+def measure_module(module, repeat):
+    totals = []
+    imports = {}
+    error = None
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                cwd=directory, capture_output=True, text=True)
+        if result.returncode:
+            # the entry points need wx and pywin32, report the failure instead of a misleading time
+            error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed"
+            break
+        parsed = parse_importtime(result.stderr)
+        totals.append(parsed[module][1] / 1000)
+        for name, (self_us, cumulative_us) in parsed.items():
+            imports.setdefault(name, []).append(cumulative_us / 1000)
+
+    if error:
+        return {"module": module, "error": error}
+    slowest = sorted(((statistics.median(times), name) for name, times in imports.items() if name != module),
+                     reverse=True)[:TOP_IMPORTS]
+    return {
+        "module": module,
+        "median_ms": statistics.median(totals),
+        "min_ms": min(totals),
+        "slowest_imports": [{"module": name, "cumulative_ms": ms} for ms, name in slowest]
+    }
+
+
+def run(args):
+    results = []
+    for module in args.modules:
+        result = measure_module(module, args.repeat)
+        if "error" in result:
+            print(f"{module}: cannot import ({result['error']})")
+        else:
+            print(f"{module}: {result['median_ms']:.1f} ms")
+        results.append(result)
+
+    report = {"python": platform.python_version(), "platform": platform.platform(), "results": results}
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as fh:
+            return report_regressions(json.load(fh), report, args.threshold, args.min_ms)
+    return 0
+
+
+def report_regressions(baseline, current, threshold, min_ms):
+    baseline_results = {result["module"]: result for result in baseline["results"] if "error" not in result}
+    regressions = 0
+    for result in current["results"]:
+        old = baseline_results.get(result["module"])
+        if old is None or "error" in result:
+            continue
+        slowdown = result["median_ms"] - old["median_ms"]
+        if slowdown > min_ms and slowdown > old["median_ms"] * threshold:
+            regressions += 1
+            print(f"REGRESSION {result['module']}: {old['median_ms']:.1f} ms -> {result['median_ms']:.1f} ms")
+    if regressions:
+        print(f"{regressions} regression(s) over {threshold:.0%}")
+        return 1
+    print("No regressions")
+    return 0
+
+
+def compare(args):
+    with open(args.baseline) as fh:
+        baseline = json.load(fh)
+    with open(args.current) as fh:
+        current = json.load(fh)
+    return report_regressions(baseline, current, args.threshold, args.min_ms)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold import times of the overlay tools.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="measure the import times")
+    run_parser.add_argument("--output", help="write the JSON report to this file")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--modules", type=lambda value: value.split(","), default=list(MODULES))
+    run_parser.add_argument("--compare", help="baseline JSON report to check for regressions")
+
+    compare_parser = subparsers.add_parser("compare", help="compare two JSON reports")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+
+    for sub in (run_parser, compare_parser):
+        sub.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+        sub.add_argument("--min-ms", type=float, default=5.0, help="ignore slowdowns smaller than this")
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        return compare(args)
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
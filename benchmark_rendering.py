@@ -0,0 +1,240 @@
+"""Benchmarks for the text-to-pixels path of the overlay.
+
+Every stage is timed for each combination of resolution, font size, text length and script:
+    mask     - create_text_image_mask on a full canvas, from the glyph atlas unless the script needs shaping
+    freetype - the same mask drawn through FreeType
+    recolor  - recolor_image_with_alpha of that mask
+    bgra     - drawing the recolored image into a DIB surface (ctypes buffer stand-in)
+    overlay  - OverlayWindow.CreateOverlayContent through the headless backend, frame cache disabled
+    dirty    - the same, switching between the text and one with a different last quarter, so only the
+               changed part is recolored and copied
+
+Usage:
+    python benchmark_rendering.py run --output baseline.json
+    python benchmark_rendering.py run --quick --compare baseline.json
+    python benchmark_rendering.py compare baseline.json current.json --threshold 0.2
+
+Peak memory is measured with tracemalloc in a separate untimed call. It covers allocations made through
+Python (bytes objects, NumPy arrays), Pillow's own image memory is not included.
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import math
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import PIL
+import textimagecreator
+from textimagecreator import create_text_image_mask, recolor_image_with_alpha
+from dib_surface import DIBSurface, BufferGdi
+from overlay_backends import HeadlessBackend
+
+RESOLUTIONS = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "4k": (3840, 2160),
+    "8k": (7680, 4320),
+}
+SAMPLE_TEXTS = {
+    "latin": "Section 2: Results and discussion of the quarterly numbers ",
+    "cyrillic": "Раздел 2: Результаты и обсуждение квартальных показателей ",
+    "greek": "Ενότητα 2: Αποτελέσματα και συζήτηση των τριμηνιαίων ",
+    "cjk": "第二部分：季度数据的结果与讨论 ",
+    "arabic": "القسم 2: النتائج ومناقشة الأرقام الفصلية ",
+}
+STAGES = ["mask", "freetype", "recolor", "bgra", "overlay", "dirty"]
+TEXT_COLOR = (120, 138, 168)
+
+
+def make_text(script, length):
+    sample = SAMPLE_TEXTS[script]
+    return (sample * (length // len(sample) + 1))[:length]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def measure(function, repeat):
+    """Time repeat calls of function, then measure its peak traced memory in one more call."""
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):  # the renderer prints on every draw
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - start) * 1000)
+
+        tracemalloc.start()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "median_ms": round(statistics.median(timings), 4),
+        "p95_ms": round(percentile(timings, 0.95), 4),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def make_overlay(width, height, text, font_path, font_size):
+    from overlay import OverlayWindow
+    with contextlib.redirect_stdout(io.StringIO()):
+        return OverlayWindow(None, None, None, None, 0, 0, width, height, None, None, None,
+                             {"font_path": font_path, "font_size": font_size, "text_color": TEXT_COLOR,
+                              "x_pos": 0, "y_pos": height // 10},
+                             [text], [], False, None, False, "",
+                             frame_cache_bytes=0, prerender_lookahead=0, backend=HeadlessBackend(width, height))
+
+
+def present(overlay_window, text):
+    overlay_window.presented_frame = None  # the whole frame is drawn, as for a text with a different size
+    overlay_window.CreateOverlayContent(text)
+
+
+def run_case(resolution, font_size, length, script, font_path, repeat):
+    width, height = RESOLUTIONS[resolution]
+    text = make_text(script, length)
+    mask = create_text_image_mask(width, height, text, font_path, font_size)
+    recolored = recolor_image_with_alpha(mask.copy(), TEXT_COLOR)
+    surface = DIBSurface(BufferGdi())
+    overlay_window = make_overlay(width, height, text, font_path, font_size)
+    changed_text = text[:length - length // 4] + make_text(script, length)[::-1][:length // 4]
+    dirty_texts = itertools.cycle([changed_text, text])
+
+    stage_functions = {
+        "mask": lambda: create_text_image_mask(width, height, text, font_path, font_size),
+        "freetype": lambda: create_text_image_mask(width, height, text, font_path, font_size, use_atlas=False),
+        "recolor": lambda: recolor_image_with_alpha(mask.copy(), TEXT_COLOR),
+        "bgra": lambda: surface.Draw(recolored),
+        "overlay": lambda: present(overlay_window, text),
+        "dirty": lambda: overlay_window.CreateOverlayContent(next(dirty_texts)),
+    }
+    results = []
+    for stage in STAGES:
+        result = {"stage": stage, "resolution": resolution, "font_size": font_size, "text_length": length,
+                  "script": script}
+        result.update(measure(stage_functions[stage], repeat))
+        results.append(result)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        overlay_window._clean_up()
+    surface.Release()
+    return results
+
+
+def run(args):
+    results = []
+    cases = [(r, s, l, sc) for r in args.resolutions for s in args.font_sizes for l in args.lengths
+             for sc in args.scripts]
+    for number, (resolution, font_size, length, script) in enumerate(cases, 1):
+        print(f"[{number}/{len(cases)}] {resolution} size={font_size} length={length} script={script}")
+        results.extend(run_case(resolution, font_size, length, script, args.font, args.repeat))
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pillow": PIL.__version__,
+            "recolor_kernel": textimagecreator.default_recolor_kernel(),
+            "repeat": args.repeat,
+            "font": args.font,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"Results written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        return report_regressions(baseline, report, args.threshold, args.min_ms)
+    return 0
+
+
+def case_key(result):
+    return result["stage"], result["resolution"], result["font_size"], result["text_length"], result["script"]
+
+
+def find_regressions(baseline, current, threshold, min_ms):
+    """Cases whose median got slower than the baseline by more than threshold (a fraction) and min_ms."""
+    baseline_results = {case_key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = baseline_results.get(case_key(result))
+        if old is None:
+            continue
+        difference = result["median_ms"] - old["median_ms"]
+        if difference > min_ms and result["median_ms"] > old["median_ms"] * (1 + threshold):
+            regressions.append((result, old))
+    return regressions
+
+
+def report_regressions(baseline, current, threshold, min_ms):
+    regressions = find_regressions(baseline, current, threshold, min_ms)
+    for result, old in regressions:
+        print(f"REGRESSION {' '.join(str(x) for x in case_key(result))}: "
+              f"{old['median_ms']:.3f} ms -> {result['median_ms']:.3f} ms")
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {threshold:.0%}")
+        return 1
+    print("No regressions")
+    return 0
+
+
+def compare(args):
+    with open(args.baseline) as fh:
+        baseline = json.load(fh)
+    with open(args.current) as fh:
+        current = json.load(fh)
+    return report_regressions(baseline, current, args.threshold, args.min_ms)
+
+
+def comma_list(convert=str):
+    return lambda value: [convert(x) for x in value.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the overlay text rendering path.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--font", default="arial.ttf", help="font file, falls back to Pillow's default font")
+    run_parser.add_argument("--resolutions", type=comma_list(), default=list(RESOLUTIONS))
+    run_parser.add_argument("--font-sizes", type=comma_list(int), default=[12, 20, 48])
+    run_parser.add_argument("--lengths", type=comma_list(int), default=[8, 32, 128])
+    run_parser.add_argument("--scripts", type=comma_list(), default=list(SAMPLE_TEXTS))
+    run_parser.add_argument("--quick", action="store_true", help="only 1080p and 4k, size 20, latin and cjk")
+    run_parser.add_argument("--compare", help="baseline JSON report to check for regressions")
+
+    compare_parser = subparsers.add_parser("compare", help="compare two JSON reports")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+
+    for sub in (run_parser, compare_parser):
+        sub.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown of the median, 0.2 = 20%%")
+        sub.add_argument("--min-ms", type=float, default=0.05, help="ignore slowdowns smaller than this")
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        return compare(args)
+    if args.quick:
+        args.resolutions, args.font_sizes, args.scripts = ["1080p", "4k"], [20], ["latin", "cjk"]
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
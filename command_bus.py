@@ -0,0 +1,104 @@
+from collections import deque
+import statistics
+import threading
+import time
+
+
+class Command:
+    def __init__(self):
+        self.posted_at = time.perf_counter()
+
+    @property
+    def name(self):
+        return type(self).__name__
+
+
+class NextSlide(Command):
+    pass
+
+
+class PrevSlide(Command):
+    pass
+
+
+class ShowOverlay(Command):
+    pass
+
+
+class HideOverlay(Command):
+    pass
+
+
+class GotoIndex(Command):
+    def __init__(self, index):
+        super().__init__()
+        self.index = index
+
+
+class TextsAppended(Command):
+    """More texts were appended to the shared text list, finished is set once loading is done."""
+
+    def __init__(self, total, finished=False):
+        super().__init__()
+        self.total = total
+        self.finished = finished
+
+
+class TextsChanged(Command):
+    """The `removed` texts from index start on were replaced by `added` new ones, after the texts file was edited."""
+
+    def __init__(self, start, removed, added):
+        super().__init__()
+        self.start = start
+        self.removed = removed
+        self.added = added
+
+
+class TextsReplaced(Command):
+    """The shared text list was replaced with newer texts, for example after the deck changed on disk."""
+
+    def __init__(self, total):
+        super().__init__()
+        self.total = total
+
+
+class CommandBus:
+    """Delivers commands between the overlay and PowerPoint threads without going through the OS input queue.
+
+    Handlers are subscribed together with the Dispatcher of the thread they must run on,
+    publishing a command posts it to each of those dispatchers.
+    """
+
+    def __init__(self):
+        self.subscribers = {}
+        self.latencies = {}  # command name -> seconds between publishing and the handler starting
+        self.lock = threading.Lock()
+
+    def Subscribe(self, command_type, dispatcher, handler):
+        with self.lock:
+            self.subscribers.setdefault(command_type, []).append((dispatcher, handler))
+
+    def Publish(self, command):
+        with self.lock:
+            subscribers = list(self.subscribers.get(type(command), []))
+        if not subscribers:
+            print(f"No subscribers for command {command.name}")
+        for dispatcher, handler in subscribers:
+            dispatcher.Post(self.Deliver, handler, command)
+
+    def Deliver(self, handler, command):
+        latency = time.perf_counter() - command.posted_at
+        with self.lock:
+            self.latencies.setdefault(command.name, deque(maxlen=1024)).append(latency)
+        handler(command)
+
+    def GetStats(self):
+        with self.lock:
+            return {
+                name: {
+                    "delivered": len(latencies),
+                    "median_latency_ms": statistics.median(latencies) * 1000,
+                    "max_latency_ms": max(latencies) * 1000
+                }
+                for name, latencies in self.latencies.items()
+            }
@@ -1,10 +1,24 @@
+from collections import OrderedDict
 import wx
-from matplotlib import font_manager
-from PIL import ImageFont
-from pynput import mouse, keyboard
-from hotkey_logger import HotkeyLogger
+from font_scan import find_system_fonts, FontIndex
 import threading
 
+LIST_FONT_SIZE = 14
+LIST_FONT_CACHE_SIZE = 64  # wx.Font objects kept for the rows of the font list, a screenful needs far fewer
+
+# checked in order, the first keyword found in the style name decides the weight
+FONT_WEIGHTS = (
+    (("extrablack",), wx.FONTWEIGHT_EXTRAHEAVY),
+    (("black",), wx.FONTWEIGHT_HEAVY),
+    (("extrabold",), wx.FONTWEIGHT_EXTRABOLD),
+    (("semibold", "demibold"), wx.FONTWEIGHT_SEMIBOLD),
+    (("bold",), wx.FONTWEIGHT_BOLD),
+    (("medium",), wx.FONTWEIGHT_MEDIUM),
+    (("extralight",), wx.FONTWEIGHT_EXTRALIGHT),
+    (("light",), wx.FONTWEIGHT_LIGHT),
+    (("thin",), wx.FONTWEIGHT_THIN),
+)
+
 CUSTOM_COLORS = {
     "cosmos": (20, 38, 68),
     "sky": (139, 195, 224),
@@ -21,6 +35,20 @@ CUSTOM_COLORS = {
 }
 
 
+def get_font_style(face_name, style_name):
+    """(face name, wx weight, wx style) of a font from the family and style names in its file."""
+    fd = style_name.lower()
+    weight = next((weight for keywords, weight in FONT_WEIGHTS if any(keyword in fd for keyword in keywords)),
+                  wx.FONTWEIGHT_NORMAL)
+    if "italic" in fd:
+        style = wx.FONTSTYLE_ITALIC
+    elif "roman" in fd:
+        style = wx.FONTSTYLE_SLANT
+    else:
+        style = wx.FONTSTYLE_NORMAL
+    return face_name, weight, style
+
+
 def get_color(value):
     """Convert a name or tuple to wx.Colour."""
     if isinstance(value, str) and value in CUSTOM_COLORS:
@@ -60,10 +88,11 @@ class NamedColourPicker(wx.ColourPickerCtrl):
 
 
 class FontListBox(wx.VListBox):
-    def __init__(self, parent, font_names, font_data):
+    def __init__(self, parent, font_names, font_styles):
         super().__init__(parent)
         self.font_names = font_names
-        self.font_data = font_data
+        self.font_styles = font_styles  # name -> (face name, wx weight, wx style)
+        self.fonts = OrderedDict()  # name -> wx.Font, least recently drawn first
         self.SetItemCount(len(font_names))
         self.selected_index = -1
         self.Bind(wx.EVT_LEFT_DOWN, self.OnMouseLeftDown)
@@ -81,46 +110,34 @@ class FontListBox(wx.VListBox):
             dc.SetPen(wx.Pen(self.GetBackgroundColour()))
             dc.DrawRectangle(rect)
 
+    def GetListFont(self, font_value):
+        font = self.fonts.get(font_value)
+        if font is not None:
+            self.fonts.move_to_end(font_value)
+            return font
+        face_name, weight, style = self.font_styles[font_value]
+        font = wx.Font(LIST_FONT_SIZE, wx.FONTFAMILY_DEFAULT, style, weight, False, faceName=face_name)
+        self.fonts[font_value] = font
+        if len(self.fonts) > LIST_FONT_CACHE_SIZE:
+            self.fonts.popitem(last=False)
+        return font
+
     def OnDrawItem(self, dc, rect, index):
         font_value = self.font_names[index]
-        font_name = self.font_data[font_value][0]
-        font_data = self.font_data[font_value][1]
-        fd = font_data.lower()
-        if "extrablack" in fd:
-            weight = wx.FONTWEIGHT_EXTRAHEAVY
-        elif "black" in fd:
-            weight = wx.FONTWEIGHT_HEAVY
-        elif "extrabold" in fd:
-            weight = wx.FONTWEIGHT_EXTRABOLD
-        elif "semibold" in fd or "demibold" in fd:
-            weight = wx.FONTWEIGHT_SEMIBOLD
-        elif "bold" in fd:
-            weight = wx.FONTWEIGHT_BOLD
-        elif "medium" in fd:
-            weight = wx.FONTWEIGHT_MEDIUM
-        elif "extralight" in fd:
-            weight = wx.FONTWEIGHT_EXTRALIGHT
-        elif "light" in fd:
-            weight = wx.FONTWEIGHT_LIGHT
-        elif "thin" in fd:
-            weight = wx.FONTWEIGHT_THIN
-        else:
-            weight = wx.FONTWEIGHT_NORMAL
-
-        if "italic" in fd:
-            style = wx.FONTSTYLE_ITALIC
-        elif "roman" in fd:
-            style = wx.FONTSTYLE_SLANT
-        else:
-            style = wx.FONTSTYLE_NORMAL
-
-        font = wx.Font(14, wx.FONTFAMILY_DEFAULT, style, weight, False, faceName=font_name)
-        dc.SetFont(font)
+        dc.SetFont(self.GetListFont(font_value))
         dc.SetTextForeground(wx.WHITE if self.IsSelected(index) else wx.BLACK)
         text_x = rect.x + 5
         text_y = rect.y + (rect.height - dc.GetTextExtent(font_value)[1]) // 2
         dc.DrawText(font_value, text_x, text_y)
 
+    def FontsChanged(self, selected_name):
+        """The font list grew while the dialog was open, keep the selected font selected."""
+        self.SetItemCount(len(self.font_names))
+        if selected_name in self.font_styles:
+            self.selected_index = self.font_names.index(selected_name)
+            self.SetSelection(self.selected_index)
+        self.Refresh()
+
     def OnMouseLeftDown(self, event):
         pos = event.GetPosition()  # relative to the VListBox control
         index = self.VirtualHitTest(pos.y)
@@ -138,9 +155,9 @@ class FontListBox(wx.VListBox):
 
 
 class FontSelectDialog(wx.Dialog):
-    def __init__(self, parent, font_names, font_data, initial_selection=None):
+    def __init__(self, parent, font_names, font_styles, initial_selection=None):
         super().__init__(parent, title="Select Font", size=(400, 300))
-        self.font_list = FontListBox(self, font_names, font_data)
+        self.font_list = FontListBox(self, font_names, font_styles)
 
         if initial_selection in font_names:
             idx = font_names.index(initial_selection)
@@ -185,70 +202,88 @@ class FontPickerCtrl(wx.Panel):
         self.font_display.SetMinSize((400, 40))
         self.pick_btn = wx.Button(self, label="Choose Font")
         self.pick_btn.SetMinSize((-1, 40))
+        self.scan_status = wx.StaticText(self, label="")
         sizer.Add(self.font_display, 1, wx.EXPAND | wx.ALL, 5)
         sizer.Add(self.pick_btn, 0, wx.ALL, 5)
+        sizer.Add(self.scan_status, 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
         self.SetSizer(sizer)
 
-        self.font_names = []
+        self.font_names = []  # shared with an open FontSelectDialog, only changed in place
         self.font_dict = {}
-        self.font_data = {}
-        for elem in font_manager.findSystemFonts():
-            fontname = ImageFont.FreeTypeFont(elem).getname()
-            name = " ".join(fontname)
-            self.font_names.append(name)
-            self.font_dict[name] = elem
-            self.font_data[name] = fontname
-        self.font_names = list(set(self.font_names))
-        self.font_names.sort()
-        self.current_font_name = initial_font or (
-            "Arial Regular" if "Arial Regular" in self.font_names else (self.font_names[0] if self.font_names else "Default"))
+        self.font_styles = {}  # name -> (face name, wx weight, wx style), worked out once per font
+        self.font_dialog = None
+        # filled by the scan thread ahead of AddFonts, GetSelectedFont waits for it when a path is needed early
+        self.scanned_paths = {}  # name -> path
+        self.scan_done = threading.Event()
+        self.font_chosen = initial_font is not None
+        self.current_font_name = initial_font or "Default"
         self.current_font = wx.Font(20, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_NORMAL, False,
                                     self.current_font_name)
         self.UpdateFontDisplay()
 
         self.pick_btn.Bind(wx.EVT_BUTTON, self.OnPickFont)
+        # names come from the font index, fonts that are new or changed since the last start are parsed by worker
+        # processes and show up in the list as they are done
+        threading.Thread(target=self.ScanFonts, daemon=True).start()
+
+    def ScanFonts(self):
+        def on_fonts(fonts, done, total):
+            for elem, fontname in fonts.items():
+                self.scanned_paths[" ".join(fontname)] = elem
+            wx.CallAfter(self.AddFonts, fonts, done, total)
+        try:
+            FontIndex().Scan(find_system_fonts(), on_fonts)
+        except Exception as e:  # a broken worker pool still leaves the fonts found so far
+            print(f"Font scan failed: {e}")
+        finally:
+            self.scan_done.set()
+
+    @staticmethod
+    def GetDefaultFontName(font_names):
+        return "Arial Regular" if "Arial Regular" in font_names else min(font_names)
+
+    def CreateFont(self, name, size):
+        face_name, weight, style = self.font_styles[name]
+        return wx.Font(size, wx.FONTFAMILY_DEFAULT, style, weight, False, face_name)
+
+    def AddFonts(self, fonts, done, total):
+        if not self:
+            return  # the window was closed during the scan
+        selected = self.font_dialog.GetSelectedFontName() if self.font_dialog else None
+        for elem, fontname in fonts.items():
+            name = " ".join(fontname)
+            self.font_dict[name] = elem
+            self.font_styles[name] = get_font_style(*fontname)
+        if fonts:
+            self.font_names[:] = sorted(self.font_styles)
+            if self.font_dialog:
+                self.font_dialog.font_list.FontsChanged(selected)
+        if not self.font_chosen and self.font_names:
+            default = self.GetDefaultFontName(self.font_styles)
+            if default != self.current_font_name:
+                self.current_font_name = default
+                self.current_font = self.CreateFont(default, self.current_font.GetPointSize())
+                self.UpdateFontDisplay()
+
+        self.scan_status.SetLabel(f"Scanning fonts {done}/{total}" if done < total else "")
+        self.GetSizer().Layout()
 
     def OnPickFont(self, event):
-        dlg = FontSelectDialog(self, self.font_names, self.font_data, initial_selection=self.current_font_name)
-        if dlg.ShowModal() == wx.ID_OK:
+        dlg = FontSelectDialog(self, self.font_names, self.font_styles, initial_selection=self.current_font_name)
+        self.font_dialog = dlg
+        result = dlg.ShowModal()
+        self.font_dialog = None
+        if result == wx.ID_OK:
             selected = dlg.GetSelectedFontName()
             if selected:
+                self.font_chosen = True
                 self.current_font_name = selected
-                name,fd = self.font_data[self.current_font_name]
-                fd = fd.lower()
-                if "extrablack" in fd:
-                    weight = wx.FONTWEIGHT_EXTRAHEAVY
-                elif "black" in fd:
-                    weight = wx.FONTWEIGHT_HEAVY
-                elif "extrabold" in fd:
-                    weight = wx.FONTWEIGHT_EXTRABOLD
-                elif "semibold" in fd or "demibold" in fd:
-                    weight = wx.FONTWEIGHT_SEMIBOLD
-                elif "bold" in fd:
-                    weight = wx.FONTWEIGHT_BOLD
-                elif "medium" in fd:
-                    weight = wx.FONTWEIGHT_MEDIUM
-                elif "extralight" in fd:
-                    weight = wx.FONTWEIGHT_EXTRALIGHT
-                elif "light" in fd:
-                    weight = wx.FONTWEIGHT_LIGHT
-                elif "thin" in fd:
-                    weight = wx.FONTWEIGHT_THIN
-                else:
-                    weight = wx.FONTWEIGHT_NORMAL
-
-                if "italic" in fd:
-                    style = wx.FONTSTYLE_ITALIC
-                elif "roman" in fd:
-                    style = wx.FONTSTYLE_SLANT
-                else:
-                    style = wx.FONTSTYLE_NORMAL
                 if self.current_font:
                     size = self.current_font.GetPointSize()
                 else:
                     size = 20
 
-                self.current_font = wx.Font(size, wx.FONTFAMILY_DEFAULT, style, weight, False, name)
+                self.current_font = self.CreateFont(selected, size)
                 self.UpdateFontDisplay()
         dlg.Destroy()
 
@@ -262,8 +297,18 @@ class FontPickerCtrl(wx.Panel):
         self.Refresh()
 
     def GetSelectedFont(self):
-        file = self.font_dict[self.current_font_name]
-        return file
+        file = self.font_dict.get(self.current_font_name)
+        if file is not None:
+            return file
+        # the scan has not reached the font yet, wait for it. AddFonts is queued behind this call, so the
+        # default font is picked here the same way it will be there
+        with wx.BusyCursor():
+            self.scan_done.wait()
+        name = self.current_font_name
+        if not self.font_chosen and self.scanned_paths:
+            name = self.GetDefaultFontName(self.scanned_paths)
+        # a font that is not installed gives a path the overlay cannot load, it falls back to the default font
+        return self.scanned_paths.get(name, "")
 
 
 class SaveFilePicker(wx.Panel):
@@ -323,6 +368,7 @@ class GlobalClickPicker(wx.Panel):
         if not self.listening:
             self.pick_button.SetLabel("Waiting for click...")
             self.listening = True
+            from pynput import mouse  # only needed once a position is picked, slow to import
             self.listener = mouse.Listener(on_click=self.OnGlobalClick)
             self.listener.start()
 
@@ -354,7 +400,7 @@ class HotkeyCtrl(wx.TextCtrl):
         self.parent = parent
         self.capturing = False
         self.hotkey_str = ""
-        self.logger = HotkeyLogger()
+        self.logger = None  # created on the first capture, importing pynput is slow
         self.Bind(wx.EVT_LEFT_DOWN, self.on_click)
 
     def on_click(self, event):
@@ -369,6 +415,10 @@ class HotkeyCtrl(wx.TextCtrl):
             self.capturing = True
             self.parent.GetParent().GetParent().GetParent().capturinghotkey = True
 
+            if self.logger is None:
+                from hotkey_logger import HotkeyLogger
+                self.logger = HotkeyLogger()
+
             def capture_thread():
                 hotkey = self.logger.start_capture()
                 wx.CallAfter(self.finish_capture, hotkey)
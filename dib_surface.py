@@ -0,0 +1,118 @@
+import ctypes
+from PIL import Image
+from wintypestructs import BITMAPINFO, BITMAPINFOHEADER
+
+try:
+    import win32gui
+    import win32con
+except ImportError:
+    win32gui = None  # only BufferGdi can be used
+
+
+SIZE_STEP = 64  # surfaces grow in steps of this many pixels so small size changes don't reallocate
+
+
+class Win32Gdi:
+    """The GDI calls DIBSurface needs: a memory DC with a 32 bit top-down DIB section selected into it."""
+
+    def CreateSurface(self, width, height):
+        hdc = win32gui.GetDC(0)
+        try:
+            memdc = win32gui.CreateCompatibleDC(hdc)
+        finally:
+            win32gui.ReleaseDC(0, hdc)
+
+        bmi = BITMAPINFO()
+        bmi.bmiHeader.biSize = ctypes.sizeof(BITMAPINFOHEADER)
+        bmi.bmiHeader.biWidth = width
+        bmi.bmiHeader.biHeight = -height  # negative height makes the DIB top-down
+        bmi.bmiHeader.biPlanes = 1
+        bmi.bmiHeader.biBitCount = 32
+        bmi.bmiHeader.biCompression = win32con.BI_RGB
+        ppvBits = ctypes.c_void_p()
+        hbitmap = ctypes.windll.gdi32.CreateDIBSection(
+            memdc, ctypes.byref(bmi), win32con.DIB_RGB_COLORS,
+            ctypes.byref(ppvBits), None, 0
+        )
+        if not hbitmap:
+            win32gui.DeleteDC(memdc)
+            raise ctypes.WinError()
+
+        old_bitmap = win32gui.SelectObject(memdc, hbitmap)
+        return memdc, hbitmap, old_bitmap, ppvBits.value
+
+    def DeleteSurface(self, memdc, hbitmap, old_bitmap):
+        win32gui.SelectObject(memdc, old_bitmap)
+        win32gui.DeleteObject(hbitmap)
+        win32gui.DeleteDC(memdc)
+
+
+class BufferGdi:
+    """Stand-in for Win32Gdi backed by ctypes buffers, so surface reuse can be exercised off Windows."""
+
+    def __init__(self):
+        self.buffers = {}
+        self.created = 0
+        self.deleted = 0
+
+    def CreateSurface(self, width, height):
+        self.created += 1
+        handle = self.created
+        buffer = (ctypes.c_ubyte * (width * height * 4))()
+        self.buffers[handle] = buffer
+        return handle, handle, None, ctypes.addressof(buffer)
+
+    def DeleteSurface(self, memdc, hbitmap, old_bitmap):
+        del self.buffers[hbitmap]
+        self.deleted += 1
+
+
+class DIBSurface:
+    """DIB section that is kept between frames and only reallocated when a frame does not fit.
+
+    Frames are pasted straight into the DIB's pixel memory through a Pillow image that wraps it,
+    so drawing a frame needs no intermediate bytes object and no GDI allocations.
+    Frame images must already hold premultiplied pixels in BGRA order.
+    """
+
+    def __init__(self, gdi):
+        self.gdi = gdi
+        self.width = 0
+        self.height = 0
+        self.memdc = None
+        self.hbitmap = None
+        self.old_bitmap = None
+        self.image = None
+
+    def Reserve(self, width, height):
+        if width <= self.width and height <= self.height:
+            return
+        width = max(self.width, -(-width // SIZE_STEP) * SIZE_STEP)
+        height = max(self.height, -(-height // SIZE_STEP) * SIZE_STEP)
+        self.Release()
+
+        self.memdc, self.hbitmap, self.old_bitmap, bits = self.gdi.CreateSurface(width, height)
+        self.width, self.height = width, height
+        pixels = (ctypes.c_ubyte * (width * height * 4)).from_address(bits)
+        self.image = Image.frombuffer("RGBA", (width, height), pixels, "raw", "RGBA", 0, 1)
+        self.image.readonly = 0  # the DIB memory is writable, let Pillow write into it instead of copying
+
+    def Draw(self, frame_image, dirty=None):
+        """Copy frame_image to the top left corner of the surface and return the DC it is selected into.
+
+        With a dirty (left, top, right, bottom) box only that part is copied, the rest of the surface must
+        already hold the same pixels.
+        """
+        self.Reserve(*frame_image.size)
+        if dirty is not None:
+            self.image.paste(frame_image.crop(dirty), dirty[:2])
+        else:
+            self.image.paste(frame_image, (0, 0))
+        return self.memdc
+
+    def Release(self):
+        if self.hbitmap:
+            self.image = None
+            self.gdi.DeleteSurface(self.memdc, self.hbitmap, self.old_bitmap)
+            self.memdc = self.hbitmap = self.old_bitmap = None
+            self.width = self.height = 0
@@ -0,0 +1,184 @@
+from collections import deque
+import statistics
+import threading
+import time
+import metrics
+
+try:
+    import win32api
+    import win32con
+    import win32event
+    import win32gui
+except ImportError:
+    win32gui = None  # only QueueMessageSource can be used
+
+WM_QUIT = 0x0012
+WM_HOTKEY = 0x0312
+MWMO_INPUTAVAILABLE = 0x0004
+
+
+class Win32MessageSource:
+    """Message queue of the calling thread plus an event that lets other threads wake it up.
+
+    Must be used from the thread whose hotkeys and windows it serves.
+    """
+
+    def __init__(self):
+        self.wake_event = win32event.CreateEvent(None, False, False, None)
+
+    def Wait(self, timeout=None):
+        milliseconds = win32event.INFINITE if timeout is None else int(timeout * 1000)
+        # MWMO_INPUTAVAILABLE also returns for messages that were already in the queue before the call
+        win32event.MsgWaitForMultipleObjectsEx([self.wake_event], milliseconds, win32event.QS_ALLINPUT,
+                                               MWMO_INPUTAVAILABLE)
+
+    def Wake(self):
+        win32event.SetEvent(self.wake_event)
+
+    def GetMessages(self):
+        """Remove all queued messages, each as (message, wparam, lparam, posted_at, raw message)."""
+        messages = []
+        while True:
+            ret = win32gui.PeekMessage(None, 0, 0, win32con.PM_REMOVE)
+            if not ret[0]:
+                return messages
+            msg = ret[1]
+            # message time is a GetTickCount value, turn it into a perf_counter timestamp
+            age = (win32api.GetTickCount() - msg[4]) & 0xFFFFFFFF
+            messages.append((msg[1], msg[2], msg[3], time.perf_counter() - age / 1000, msg))
+
+    def DispatchMessage(self, raw):
+        win32gui.TranslateMessage(raw)
+        win32gui.DispatchMessage(raw)
+
+
+class QueueMessageSource:
+    """Stand-in for Win32MessageSource, messages are posted from any thread with Post.
+
+    Counts how often Wait returns so idle wakeups can be measured.
+    """
+
+    def __init__(self):
+        self.messages = deque()
+        self.condition = threading.Condition()
+        self.woken = False
+        self.wakeups = 0
+
+    def Post(self, msg, wparam=0, lparam=0):
+        with self.condition:
+            self.messages.append((msg, wparam, lparam, time.perf_counter(), None))
+            self.condition.notify()
+
+    def Wait(self, timeout=None):
+        with self.condition:
+            self.condition.wait_for(lambda: self.messages or self.woken, timeout)
+            self.woken = False
+            self.wakeups += 1
+
+    def Wake(self):
+        with self.condition:
+            self.woken = True
+            self.condition.notify()
+
+    def GetMessages(self):
+        with self.condition:
+            messages = list(self.messages)
+            self.messages.clear()
+            return messages
+
+    def DispatchMessage(self, raw):
+        pass
+
+
+class Dispatcher:
+    """Message loop of one thread: sleeps until a message or an internal command arrives.
+
+    WM_HOTKEY messages are routed by hotkey ID to the registered handlers, other messages are dispatched
+    to their windows. Commands posted from other threads run on the dispatcher's thread.
+    """
+
+    def __init__(self, source, name="Dispatcher"):
+        self.source = source
+        self.name = name
+        self.hotkey_handlers = {}
+        self.commands = deque()
+        self.commands_lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+        self.wakeups = 0
+        self.dispatched = 0
+        self.latencies = deque(maxlen=1024)  # seconds between a message being posted and its handler starting
+        self.hotkey_metric = f"{name}.hotkeys"
+        self.latency_metric = f"{name}.hotkey_latency"
+        self.handled_metric = f"{name}.hotkey_handled"
+
+    def RegisterHotkeyHandler(self, hotkey_id, handler):
+        self.hotkey_handlers[hotkey_id] = handler
+
+    def Post(self, function, *args):
+        """Run function(*args) on the dispatcher's thread, can be called from any thread."""
+        with self.commands_lock:
+            self.commands.append((function, args, time.perf_counter()))
+        self.source.Wake()
+
+    def Stop(self):
+        """Make Run return right away, can be called from any thread."""
+        self.stop_event.set()
+        self.source.Wake()
+
+    def IsStopped(self):
+        return self.stop_event.is_set()
+
+    def Run(self):
+        while not self.stop_event.is_set():
+            self.source.Wait()
+            self.wakeups += 1
+            self.RunPending()
+
+    def RunPending(self):
+        while not self.stop_event.is_set():
+            with self.commands_lock:
+                if not self.commands:
+                    break
+                function, args, posted_at = self.commands.popleft()
+            self.RecordLatency(posted_at)
+            function(*args)
+
+        for msg, wparam, lparam, posted_at, raw in self.source.GetMessages():
+            if self.stop_event.is_set():
+                return
+            if msg == WM_QUIT:
+                print(f"{self.name}: WM_QUIT received.")
+                self.stop_event.set()
+                return
+            if msg == WM_HOTKEY:
+                self.DispatchHotkey(wparam, posted_at)
+            elif raw is not None:
+                self.source.DispatchMessage(raw)
+
+    def DispatchHotkey(self, hotkey_id, posted_at=None):
+        handler = self.hotkey_handlers.get(hotkey_id)
+        if handler is None:
+            return
+        metrics.registry.Increment(self.hotkey_metric)
+        if posted_at is not None:
+            metrics.registry.Record(self.latency_metric, self.RecordLatency(posted_at))
+        handler()
+        if posted_at is not None:
+            # from the key press to the handler being done, for the overlay that is until the frame is on screen
+            metrics.registry.Record(self.handled_metric, time.perf_counter() - posted_at)
+
+    def RecordLatency(self, posted_at):
+        latency = time.perf_counter() - posted_at
+        self.dispatched += 1
+        self.latencies.append(latency)
+        return latency
+
+    def GetStats(self):
+        latencies = list(self.latencies)
+        return {
+            "wakeups": self.wakeups,
+            "dispatched": self.dispatched,
+            "median_latency_ms": statistics.median(latencies) * 1000 if latencies else None,
+            "max_latency_ms": max(latencies) * 1000 if latencies else None,
+        }
@@ -0,0 +1,176 @@
+"""Finds the installed font files and their names.
+
+The family and style names read from every font file are kept in an index on disk, so only fonts that were added
+or changed since the last start have to be opened.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import json
+import os
+import sys
+
+from PIL import ImageFont
+
+FONT_EXTENSIONS = (".ttf", ".otf", ".ttc")
+FONT_INDEX_PATH = "font_index.json"
+SCAN_CHUNK_SIZE = 32  # font files parsed per task of the worker processes
+
+
+def get_font_directories():
+    if sys.platform == "win32":
+        windir = os.environ.get("WINDIR", r"C:\Windows")
+        directories = [os.path.join(windir, "Fonts")]
+        local_app_data = os.environ.get("LOCALAPPDATA")
+        if local_app_data:
+            # fonts installed for the current user only
+            directories.append(os.path.join(local_app_data, "Microsoft", "Windows", "Fonts"))
+        return directories
+    home = os.path.expanduser("~")
+    if sys.platform == "darwin":
+        return ["/Library/Fonts", "/System/Library/Fonts", os.path.join(home, "Library", "Fonts")]
+    data_home = os.environ.get("XDG_DATA_HOME") or os.path.join(home, ".local", "share")
+    return ["/usr/share/fonts", "/usr/local/share/fonts", os.path.join(home, ".fonts"),
+            os.path.join(data_home, "fonts")]
+
+
+def find_system_fonts(directories=None):
+    """Paths of all font files in the font directories and their subdirectories."""
+    fonts = []
+    seen = set()
+    pending = list(directories or get_font_directories())
+    while pending:
+        directory = pending.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue  # missing or unreadable directory
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    pending.append(entry.path)
+                elif entry.name.lower().endswith(FONT_EXTENSIONS):
+                    key = os.path.normcase(os.path.realpath(entry.path))
+                    if key not in seen:
+                        seen.add(key)
+                        fonts.append(entry.path)
+            except OSError:
+                continue
+    return fonts
+
+
+def read_font_names(path):
+    """(family, style) of a font file, None if it cannot be read."""
+    try:
+        return ImageFont.FreeTypeFont(path).getname()
+    except (OSError, ValueError) as e:
+        print(f"Cannot read font {path}: {e}")
+        return None
+
+
+def read_font_names_chunk(paths):
+    """Worker process task: [(path, names)] for a chunk of font files."""
+    return [(path, read_font_names(path)) for path in paths]
+
+
+class FontIndex:
+    """Family and style names of font files, stored in a JSON file and keyed by path, size and mtime."""
+
+    def __init__(self, index_path=FONT_INDEX_PATH):
+        self.index_path = index_path
+        self.entries = self.Load()
+
+    def Load(self):
+        try:
+            with open(self.index_path, encoding="utf-8") as fh:
+                entries = json.load(fh)
+            return entries if isinstance(entries, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Cannot read font index {self.index_path}, rebuilding it: {e}")
+            return {}
+
+    def Save(self):
+        temp_path = self.index_path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as fh:
+                json.dump(self.entries, fh, ensure_ascii=False)
+            os.replace(temp_path, self.index_path)
+        except OSError as e:
+            print(f"Cannot write font index {self.index_path}: {e}")
+
+    def GetStale(self, paths):
+        """Split paths into {path: names} of fonts the index still knows and a list of fonts to read again.
+
+        Fonts that are no longer installed are dropped from the index.
+        """
+        known = {}
+        stale = []
+        current = set(paths)
+        for path in list(self.entries):
+            if path not in current:
+                del self.entries[path]
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                self.entries.pop(path, None)
+                continue
+            entry = self.entries.get(path)
+            if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+                if entry["names"] is not None:
+                    known[path] = tuple(entry["names"])
+            else:
+                stale.append(path)
+        return known, stale
+
+    def Add(self, path, names):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        # fonts that could not be read are remembered too, so they are not opened on every start
+        self.entries[path] = {"size": stat.st_size, "mtime": stat.st_mtime_ns,
+                              "names": list(names) if names else None}
+
+    def Update(self, paths, workers=None):
+        """Return {path: (family, style)} for all readable fonts, reading only new and changed files."""
+        fonts = {}
+        self.Scan(paths, lambda found, done, total: fonts.update(found), workers)
+        return fonts
+
+    def Scan(self, paths, on_fonts, workers=None, chunk_size=SCAN_CHUNK_SIZE):
+        """Like Update, but hands the fonts to on_fonts(fonts, done, total) as they become known.
+
+        The fonts the index still knows come first in one call, the rest are parsed in chunks by a pool of worker
+        processes and each chunk is handed over as soon as it is done. done and total count the fonts that had
+        to be parsed. Runs in the calling thread, start it on a worker thread to keep a GUI responsive.
+        """
+        fonts, stale = self.GetStale(paths)
+        total = len(stale)
+        on_fonts(fonts, 0, total)
+        if not stale:
+            self.Save()
+            return
+        chunks = [stale[i:i + chunk_size] for i in range(0, total, chunk_size)]
+        done = 0
+        if len(chunks) == 1:
+            # starting worker processes costs more than parsing a handful of fonts
+            results = [read_font_names_chunk(chunks[0])]
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            results = (future.result() for future in
+                       as_completed([executor.submit(read_font_names_chunk, chunk) for chunk in chunks]))
+        try:
+            for result in results:
+                fonts = {}
+                for path, names in result:
+                    self.Add(path, names)
+                    if names:
+                        fonts[path] = tuple(names)
+                done += len(result)
+                on_fonts(fonts, done, total)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        self.Save()
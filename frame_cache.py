@@ -0,0 +1,80 @@
+from collections import OrderedDict
+import threading
+
+
+class RenderedFrame:
+    """Overlay frame ready to be copied into a bitmap: premultiplied BGRA pixels and their offset on the canvas."""
+
+    def __init__(self, image, offset=(0, 0)):
+        self.image = image
+        self.offset = offset
+
+    @property
+    def size(self):
+        return self.image.size
+
+    @property
+    def nbytes(self):
+        return self.image.width * self.image.height * 4
+
+
+class FrameCache:
+    """LRU cache of rendered frames that never holds more than max_bytes of pixel data."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.frames = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def MakeKey(text, font_path, font_size, text_color, canvas_size):
+        return text, font_path, font_size, tuple(text_color), tuple(canvas_size)
+
+    def Get(self, key):
+        with self.lock:
+            frame = self.frames.get(key)
+            if frame is None:
+                self.misses += 1
+                return None
+            self.frames.move_to_end(key)
+            self.hits += 1
+            return frame
+
+    def Contains(self, key):
+        """Check for a frame without counting a hit or miss or changing its LRU position."""
+        with self.lock:
+            return key in self.frames
+
+    def Put(self, key, frame):
+        if frame.nbytes > self.max_bytes:
+            return  # would evict everything else and still not fit
+        with self.lock:
+            old = self.frames.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old.nbytes
+            self.frames[key] = frame
+            self.current_bytes += frame.nbytes
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self.frames.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def Clear(self):
+        with self.lock:
+            self.frames.clear()
+            self.current_bytes = 0
+
+    def GetStats(self):
+        with self.lock:
+            return {
+                "frames": len(self.frames),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
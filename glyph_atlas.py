@@ -0,0 +1,164 @@
+"""Glyph atlas renderer: every glyph of a font is rasterized once, texts are put together from the cached tiles.
+
+Overlay decks reuse a small alphabet at one font size, so once their glyphs are in the atlas a text is drawn by
+copying tiles, without FreeType. Glyphs are placed with cached advances and pair kerning the same way Pillow's
+basic layout places them, and overlapping glyphs are blended like Pillow blends them, so the masks are the same.
+
+Texts that need shaping (right-to-left and Indic scripts, combining marks, joiners) cannot be put together glyph
+by glyph, needs_shaping tells the caller to draw those through FreeType. Needs NumPy.
+"""
+import threading
+import unicodedata
+
+from PIL import Image, ImageDraw
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ATLAS_WIDTH = 1024
+ATLAS_INITIAL_HEIGHT = 256
+
+# Hebrew up to Myanmar, Khmer and Mongolian, and the Hebrew and Arabic presentation forms
+SHAPING_RANGES = ((0x0590, 0x109F), (0x1780, 0x18AF), (0xFB1D, 0xFDFF), (0xFE70, 0xFEFF))
+SHAPING_CATEGORIES = ("Mn", "Mc", "Me", "Cf")  # combining marks and format characters such as joiners
+
+
+def needs_shaping(text):
+    """True if text has characters whose glyphs depend on their neighbours or on the text direction."""
+    for char in text:
+        code = ord(char)
+        if code < 0x0300:
+            continue  # Latin, nothing to shape
+        if unicodedata.category(char) in SHAPING_CATEGORIES:
+            return True
+        for low, high in SHAPING_RANGES:
+            if low <= code <= high:
+                return True
+    return False
+
+
+class GlyphLayout:
+    """Tiles of a laid out text and its bounding box relative to the anchor, like font.getbbox."""
+
+    def __init__(self, glyphs, bbox, pixels):
+        self.glyphs = glyphs  # [(x, y, atlas x, atlas y, width, height)], x and y relative to the anchor
+        self.bbox = bbox
+        self.pixels = pixels  # the atlas the tiles are in, it is replaced when it grows
+
+
+class GlyphAtlas:
+    """Alpha tiles of the glyphs of one FreeType font, packed row by row into a single array."""
+
+    def __init__(self, font):
+        self.font = font
+        self.pixels = numpy.zeros((ATLAS_INITIAL_HEIGHT, ATLAS_WIDTH), numpy.uint8)
+        self.glyphs = {}  # char -> (atlas x, atlas y, width, height, bbox relative to the pen position)
+        self.advances = {}
+        self.kerning = {}  # (char, next char) -> adjustment of the advance of char
+        self.row_x = 0
+        self.row_y = 0
+        self.row_height = 0
+        self.lock = threading.Lock()
+
+    def GetGlyph(self, char):
+        glyph = self.glyphs.get(char)
+        if glyph is None:
+            glyph = self.AddGlyph(char)
+        return glyph
+
+    def AddGlyph(self, char):
+        # the bbox of a single character covers its ink and its advance, see Layout
+        bbox = self.font.getbbox(char)
+        left, top, right, bottom = bbox
+        width, height = right - left, bottom - top
+        if width <= 0 or height <= 0:
+            glyph = (0, 0, 0, 0, bbox)
+        else:
+            tile = Image.new("L", (width, height), 0)
+            ImageDraw.Draw(tile).text((-left, -top), char, font=self.font, fill=255)
+            x, y = self.Allocate(width, height)
+            self.pixels[y:y + height, x:x + width] = numpy.asarray(tile)
+            glyph = (x, y, width, height, bbox)
+        self.glyphs[char] = glyph
+        return glyph
+
+    def Allocate(self, width, height):
+        """Position of a free width x height area, starting a new row or growing the atlas as needed."""
+        if self.row_x + width > self.pixels.shape[1]:
+            self.row_x = 0
+            self.row_y += self.row_height
+            self.row_height = 0
+        needed = (self.row_y + height, max(width, self.pixels.shape[1]))
+        if needed[0] > self.pixels.shape[0] or needed[1] > self.pixels.shape[1]:
+            # a new array, layouts of other threads keep using the old one
+            grown = numpy.zeros((max(needed[0], self.pixels.shape[0] * 2), needed[1]), numpy.uint8)
+            grown[:self.pixels.shape[0], :self.pixels.shape[1]] = self.pixels
+            self.pixels = grown
+        x, y = self.row_x, self.row_y
+        self.row_x += width
+        self.row_height = max(self.row_height, height)
+        return x, y
+
+    def GetAdvance(self, char):
+        advance = self.advances.get(char)
+        if advance is None:
+            advance = self.advances[char] = self.font.getlength(char)
+        return advance
+
+    def GetKerning(self, char, next_char):
+        pair = (char, next_char)
+        kerning = self.kerning.get(pair)
+        if kerning is None:
+            kerning = self.font.getlength(char + next_char) - self.GetAdvance(char) - self.GetAdvance(next_char)
+            self.kerning[pair] = kerning
+        return kerning
+
+    def Layout(self, text):
+        glyphs = []
+        left = top = right = bottom = None
+        pen = 0.0
+        previous = None
+        with self.lock:
+            for char in text:
+                if previous is not None:
+                    pen += self.GetKerning(previous, char)
+                atlas_x, atlas_y, width, height, (glyph_left, glyph_top, glyph_right, glyph_bottom) = \
+                    self.GetGlyph(char)
+                x = round(pen)  # pen positions are in 1/64 pixels, glyphs are rasterized on whole pixels
+                left = x + glyph_left if left is None else min(left, x + glyph_left)
+                right = x + glyph_right if right is None else max(right, x + glyph_right)
+                top = glyph_top if top is None else min(top, glyph_top)
+                bottom = glyph_bottom if bottom is None else max(bottom, glyph_bottom)
+                if width:
+                    glyphs.append((x + glyph_left, glyph_top, atlas_x, atlas_y, width, height))
+                pen += self.GetAdvance(char)
+                previous = char
+            pixels = self.pixels
+        bbox = (left, top, right, bottom) if text else (0, 0, 0, 0)
+        return GlyphLayout(glyphs, bbox, pixels)
+
+    @staticmethod
+    def RenderMask(layout, size, position):
+        """L mode image of given size with the text's anchor at position, glyphs outside of it are clipped."""
+        width, height = size
+        mask = numpy.zeros((height, width), numpy.uint8)
+        for x, y, atlas_x, atlas_y, tile_width, tile_height in layout.glyphs:
+            x += position[0]
+            y += position[1]
+            # clip the tile to the mask
+            x0, y0 = max(x, 0), max(y, 0)
+            x1, y1 = min(x + tile_width, width), min(y + tile_height, height)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            tile = layout.pixels[atlas_y + y0 - y:atlas_y + y1 - y, atlas_x + x0 - x:atlas_x + x1 - x]
+            region = mask[y0:y1, x0:x1]
+            if not region.any():
+                region[...] = tile
+                continue
+            # overlapping glyphs are blended like "over" with rounding, the same way FreeType text is drawn
+            # (the uint8 sums wrap around, but the result always fits)
+            blend = region.astype(numpy.uint16) * tile
+            region[...] = region + tile - ((blend + 127) // 255).astype(numpy.uint8)
+        return Image.fromarray(mask)
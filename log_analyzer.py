@@ -0,0 +1,151 @@
+"""Dwell-time statistics over structured session logs (the general setting structured_log_path).
+
+Every log file is read line by line in a worker process. The time a text was shown is the time from the event
+that showed it to the next event of the same session, and visits of the same text within a session are added up.
+Statistics are then taken over sessions, per text and per section.
+
+Usage:
+    python log_analyzer.py rehearsals/
+    python log_analyzer.py session1.jsonl session2.jsonl --workers 8 --output report.json
+"""
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+
+LOG_EXTENSIONS = (".jsonl", ".json", ".log")
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def find_log_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names) if name.endswith(LOG_EXTENSIONS))
+        else:
+            files.append(path)
+    return files
+
+
+def analyze_file(path):
+    """Return the per session dwell totals of one log file as (sessions, events, bad lines, error).
+
+    sessions maps a session id to {"texts": {text: seconds}, "sections": {section: seconds}}. error describes
+    why the file could not be read, it is None if it was.
+    """
+    sessions = {}
+    previous = {}  # session id -> last event
+    events = 0
+    bad_lines = 0
+    try:
+        with open(path, encoding="utf-8", errors="replace") as fh:
+            for line in fh:
+                try:
+                    event = json.loads(line)
+                    session_id = f"{path}#{event['session']}"
+                    timestamp = float(event["monotonic"])
+                except (ValueError, KeyError, TypeError):
+                    bad_lines += bool(line.strip())
+                    continue
+                events += 1
+                totals = sessions.setdefault(session_id, {"texts": {}, "sections": {}})
+
+                last = previous.get(session_id)
+                if last is not None and last["index"] is not None:
+                    dwell = max(timestamp - float(last["monotonic"]), 0.0)
+                    texts = totals["texts"]
+                    texts[last["text"]] = texts.get(last["text"], 0.0) + dwell
+                    if last.get("section") is not None:
+                        sections = totals["sections"]
+                        sections[last["section"]] = sections.get(last["section"], 0.0) + dwell
+                # the text shown after an end event was never on screen
+                previous[session_id] = None if event.get("event") == "end" else event
+    except OSError as e:
+        return {}, 0, 0, str(e)  # one unreadable file does not stop the others
+    return sessions, events, bad_lines, None
+
+
+def summarize(per_session):
+    """Statistics over sessions of {name: [seconds in each session that showed it]}."""
+    summary = {}
+    for name, values in per_session.items():
+        summary[name] = {
+            "sessions": len(values),
+            "mean_s": statistics.fmean(values),
+            "median_s": statistics.median(values),
+            "p95_s": percentile(values, 0.95),
+            "max_s": max(values),
+            "total_s": sum(values)
+        }
+    return dict(sorted(summary.items(), key=lambda item: -item[1]["total_s"]))
+
+
+def analyze(paths, workers):
+    texts = {}
+    sections = {}
+    report = {"files": len(paths), "unreadable_files": 0, "sessions": 0, "events": 0, "bad_lines": 0}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # results are merged in the main process as each file finishes, files themselves are streamed
+        for path, (sessions, events, bad_lines, error) in zip(paths, executor.map(analyze_file, paths, chunksize=4)):
+            if error is not None:
+                print(f"{path}: cannot read file, skipping it: {error}", file=sys.stderr)
+                report["unreadable_files"] += 1
+                continue
+            if bad_lines:
+                print(f"{path}: skipped {bad_lines} malformed line(s)", file=sys.stderr)
+            report["sessions"] += len(sessions)
+            report["events"] += events
+            report["bad_lines"] += bad_lines
+            for totals in sessions.values():
+                for name, seconds in totals["texts"].items():
+                    texts.setdefault(name, []).append(seconds)
+                for name, seconds in totals["sections"].items():
+                    sections.setdefault(name, []).append(seconds)
+    report["texts"] = summarize(texts)
+    report["sections"] = summarize(sections)
+    return report
+
+
+def print_table(title, summary, top):
+    print(f"\n{title}")
+    print(f"{'sessions':>8} {'mean':>8} {'median':>8} {'p95':>8} {'max':>8}  name")
+    for name, stats in list(summary.items())[:top]:
+        print(f"{stats['sessions']:>8} {stats['mean_s']:>7.1f}s {stats['median_s']:>7.1f}s {stats['p95_s']:>7.1f}s "
+              f"{stats['max_s']:>7.1f}s  {name}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-text and per-section dwell times across overlay sessions.")
+    parser.add_argument("paths", nargs="+", help="structured log files or directories containing them")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, defaults to the CPU count")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--top", type=int, default=20, help="rows to print per table")
+    args = parser.parse_args(argv)
+
+    paths = find_log_files(args.paths)
+    if not paths:
+        print("No log files found")
+        return 1
+    report = analyze(paths, args.workers)
+
+    print(f"{report['files']} file(s), {report['sessions']} session(s), {report['events']} event(s)")
+    if report["sections"]:
+        print_table("Sections", report["sections"], args.top)
+    print_table("Texts", report["texts"], args.top)
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"\nReport written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
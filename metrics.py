@@ -0,0 +1,164 @@
+"""In-process counters and latency histograms for the hotkey-to-pixels path.
+
+Instrumented code goes through the module level `registry`, which does nothing until Enable is called:
+
+    with metrics.registry.Time("overlay.render"):
+        ...
+    metrics.registry.Increment("overlay.frames")
+"""
+from contextlib import nullcontext
+import json
+import threading
+import time
+
+SUB_BUCKET_BITS = 7  # 128 linear sub-buckets per power of two, values are kept to within 1%
+NULL_TIMER = nullcontext()
+
+
+class Histogram:
+    """HDR-style histogram of durations in microseconds: buckets are linear within each power of two.
+
+    Recording is a constant time dictionary update no matter how many values were recorded.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def BucketIndex(value):
+        exponent = max(value.bit_length() - SUB_BUCKET_BITS, 0)
+        return (exponent << SUB_BUCKET_BITS) + (value >> exponent)
+
+    @staticmethod
+    def BucketValue(index):
+        """Middle of the range of values that fall into the bucket."""
+        exponent = index >> SUB_BUCKET_BITS
+        mantissa = index & ((1 << SUB_BUCKET_BITS) - 1)
+        return ((mantissa << exponent) + ((mantissa + 1) << exponent) - 1) / 2
+
+    def Record(self, seconds):
+        value = max(int(seconds * 1000000), 0)
+        index = self.BucketIndex(value)
+        with self.lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+            self.min = value if self.min is None else min(self.min, value)
+
+    def Percentile(self, fraction):
+        """Value in microseconds below which the given fraction of recorded values lie."""
+        with self.lock:
+            counts = sorted(self.counts.items())
+            count, maximum = self.count, self.max
+        return self.FindPercentile(counts, count, maximum, fraction)
+
+    @classmethod
+    def FindPercentile(cls, counts, count, maximum, fraction):
+        """Percentile of sorted (bucket index, count) pairs holding count values."""
+        if not count:
+            return None
+        target = max(fraction * count, 1)
+        seen = 0
+        for index, bucket_count in counts:
+            seen += bucket_count
+            if seen >= target:
+                return cls.BucketValue(index)
+        return maximum
+
+    def Snapshot(self):
+        # everything is copied under the lock, so the statistics agree with each other during concurrent Records
+        with self.lock:
+            counts = sorted(self.counts.items())
+            count, total, minimum, maximum = self.count, self.total, self.min, self.max
+        if not count:
+            return {"count": 0}
+        return {
+            "count": count,
+            "min_ms": minimum / 1000,
+            "mean_ms": total / count / 1000,
+            "p50_ms": self.FindPercentile(counts, count, maximum, 0.5) / 1000,
+            "p90_ms": self.FindPercentile(counts, count, maximum, 0.9) / 1000,
+            "p99_ms": self.FindPercentile(counts, count, maximum, 0.99) / 1000,
+            "max_ms": maximum / 1000
+        }
+
+
+class Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.Record(time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    """Named counters and histograms, all calls return right away while the registry is disabled."""
+
+    def __init__(self):
+        self.enabled = False
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def Enable(self):
+        self.enabled = True
+
+    def Disable(self):
+        self.enabled = False
+
+    def GetHistogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def Increment(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def Record(self, name, seconds):
+        if not self.enabled:
+            return
+        self.GetHistogram(name).Record(seconds)
+
+    def Time(self, name):
+        """Context manager recording how long its block took."""
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self.GetHistogram(name))
+
+    def Snapshot(self):
+        """Current values of all metrics, can be called from any thread while they are being recorded."""
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = dict(self.histograms)
+        return {
+            "counters": counters,
+            "histograms": {name: histogram.Snapshot() for name, histogram in sorted(histograms.items())}
+        }
+
+    def DumpJson(self, path):
+        try:
+            with open(path, "w") as fh:
+                json.dump(self.Snapshot(), fh, indent=2)
+            print(f"Metrics written to {path}")
+        except OSError as e:
+            print(f"Cannot write metrics to {path}: {e}")
+
+
+registry = MetricsRegistry()
@@ -1,64 +1,98 @@
-import ctypes
-import win32gui
-import win32con
-import win32api
-from wintypestructs import BITMAPINFO, BITMAPINFOHEADER
-from textimagecreator import create_text_image
+from textimagecreator import create_text_image_mask, create_text_image_mask_tight, recolor_image_with_alpha, \
+    recolor_changed_region, get_changed_box
+from frame_cache import FrameCache, RenderedFrame
+from prerender import PrerenderWorker
+from overlay_backends import Win32LayeredWindowBackend, WM_DESTROY
+from dispatcher import Dispatcher, WM_HOTKEY
+from session_logger import SessionLogger
+from pptx_extractor import get_section
+import command_bus as commands
+import metrics
+import profiling
 from hotkeys import *
 import datetime
+import json
 import threading
+import time
 import atexit
 
 
 class OverlayWindow:
     def __init__(self, extended_style, class_name, window_name, style, x_pos, y_pos, width, height, parent_window,
                  h_menu, lp_void, text_settings, texts, hotkey_list, simultaneous_change, simulated_hotkeys, create_log,
-                 log_path):
+                 log_path, tight_render=True, frame_cache_bytes=64 * 1024 * 1024,
+                 prerender_lookahead=2, backend=None, command_bus=None, placeholder_text="Loading slide titles...",
+                 structured_log_path=None, texts_are_slides=False, glyph_atlas=True, section_names=None):
         self.hotkey_list = hotkey_list
         self.simultaneous_change = simultaneous_change
         self.simulated_hotkeys = simulated_hotkeys
+        # slide changes are sent over the command bus, simulated hotkeys are only used without one
+        self.command_bus = command_bus
         self.create_log = create_log
         self.log_path = log_path
-        self.log_file = None
-
-        self.extended_style = extended_style
-        self.class_name = class_name
-        self.window_name = window_name
-        self.style = style
-        self.x_pos = x_pos
-        self.y_pos = y_pos
+        # log lines are written on a background thread, the file stays open for the whole session
+        self.session_logger = SessionLogger(log_path) if create_log else None
+        # optional JSON lines event log for log_analyzer.py, texts_are_slides adds the slide and section to events
+        # and shows the placeholder while the titles load
+        self.event_logger = SessionLogger(structured_log_path) if structured_log_path else None
+        self.texts_are_slides = texts_are_slides
+        # the deck's section names, may be filled in later, tell section and title apart when both contain ": "
+        self.section_names = section_names if section_names is not None else []
+        self.session_id = datetime.datetime.now().isoformat()
+        self.start_monotonic = None
+
         self.width = width
         self.height = height
-        self.parent_window = parent_window
-        self.h_menu = h_menu
-        self.h_instance = win32api.GetModuleHandle(None)
-        self.lp_void = lp_void
+        # the backend owns the window, hotkeys and message queue, by default a layered Win32 window
+        self.backend = backend or Win32LayeredWindowBackend(extended_style, class_name, window_name, style, x_pos,
+                                                            y_pos, width, height, parent_window, h_menu, lp_void)
 
         self.font_path = text_settings["font_path"]
         self.font_size = text_settings["font_size"]
         self.text_color = text_settings["text_color"]
         self.text_x_pos = text_settings["x_pos"]
         self.text_y_pos = -1 * text_settings["y_pos"]
-
+        # in tight render mode only the text's ink box is drawn and the window is moved and resized to it
+        # instead of covering a canvas of the full width and height
+        self.tight_render = tight_render
+        # texts are put together from glyphs rasterized once per font, texts that need shaping are still drawn
+        # through FreeType
+        self.glyph_atlas = glyph_atlas
+        # frame the window and the DIB section currently hold, the next frame only updates what changed
+        # if it has the same position and size
+        self.presented_frame = None
+        # rendered frames are kept so that going back to a text that was already shown only needs a blit
+        self.frame_cache = FrameCache(frame_cache_bytes)
+        self.prerender_worker = PrerenderWorker(self.PrerenderFrame, prerender_lookahead) \
+            if prerender_lookahead > 0 else None
+
+        # slide titles may still be loading, the list then grows while the overlay runs and the placeholder is
+        # shown until the first title arrives. An empty texts file just shows nothing until lines are added
         self.texts = texts
         self.counter = 0
-        self.current_text = self.texts[self.counter]
+        self.showing_placeholder = texts_are_slides and not self.texts
+        if self.showing_placeholder:
+            self.current_text = placeholder_text
+        else:
+            self.current_text = self.texts[self.counter] if self.texts else ""
 
         # Thread safety and cleanup
         self.stop_event = threading.Event()
         self.window = None
-        self.registered_class = None
         self._cleaned_up = False
+        self.dispatcher = Dispatcher(self.backend.CreateMessageSource(), "OverlayWindow")
 
         # Register cleanup function
         atexit.register(self._clean_up)
 
         try:
-            self.registered_class = self.RegisterClass()
-            self.window = self.CreateWindow()
+            self.window = self.backend.CreateWindow(self.ProcessMessages)
             self.ShowWindow()
             self.CreateOverlayContent(self.current_text)
+            self.SchedulePrerender()
             self.starttime = datetime.datetime.now()
+            self.start_monotonic = time.monotonic()  # log timestamps must not jump with the wall clock
+            self.LogEvent("start", self.start_monotonic)
         except Exception as e:
             print(f"Error initializing OverlayWindow: {e}")
             self._clean_up()
@@ -68,101 +102,152 @@ class OverlayWindow:
         """Signal the message loop to exit and destroy the window."""
         print("OverlayWindow: Stop signal received.")
         self.stop_event.set()
-        #
-        # # Post quit message to exit the message loop
-        # try:
-        #     win32gui.PostQuitMessage(0)
-        # except Exception as e:
-        #     print(f"Error posting quit message: {e}")
-
-    def CreateWindow(self):
-        return win32gui.CreateWindowEx(
-            self.extended_style,
-            self.registered_class,
-            self.window_name,
-            self.style,
-            self.x_pos,
-            self.y_pos,
-            self.width,
-            self.height,
-            self.parent_window,
-            self.h_menu,
-            self.h_instance,
-            self.lp_void
-        )
-
-    def RegisterClass(self):
-        wndClass = win32gui.WNDCLASS()
-        wndClass.lpfnWndProc = self.ProcessMessages
-        wndClass.hInstance = self.h_instance
-        wndClass.lpszClassName = self.class_name
-        wndClass.hCursor = win32gui.LoadCursor(0, win32con.IDC_ARROW)
-        return win32gui.RegisterClass(wndClass)
+        self.dispatcher.Stop()  # wakes the message loop right away
 
     def HideOverlay(self):
         if self.window:
-            win32gui.ShowWindow(self.window, win32con.SW_HIDE)
+            self.backend.Hide()
 
     def ShowOverlay(self):
         if self.window:
-            win32gui.ShowWindow(self.window, win32con.SW_SHOW)
+            self.backend.Show()
+
+    def GetHotkeyHandlers(self):
+        return {
+            HOTKEY_HIDE: self.HideOverlay,
+            HOTKEY_SHOW: self.ShowOverlay,
+            HOTKEY_NEXTTEXT: self.NextText,
+            HOTKEY_PREVTEXT: self.PreviousText,
+            HOTKEY_STARTTIMER: self.StartTimer
+        }
+
+    def SubscribeCommands(self, bus):
+        bus.Subscribe(commands.ShowOverlay, self.dispatcher, lambda command: self.ShowOverlay())
+        bus.Subscribe(commands.HideOverlay, self.dispatcher, lambda command: self.HideOverlay())
+        bus.Subscribe(commands.TextsAppended, self.dispatcher, self.OnTextsAppended)
+        bus.Subscribe(commands.TextsReplaced, self.dispatcher, self.OnTextsReplaced)
+        bus.Subscribe(commands.TextsChanged, self.dispatcher, self.OnTextsChanged)
+
+    def OnTextsAppended(self, command):
+        if not self.showing_placeholder:
+            return  # the new texts are picked up when the presenter navigates to them
+        if self.texts:
+            self.showing_placeholder = False
+            self.current_text = self.texts[self.counter]
+            self.CreateOverlayContent(self.current_text)
+            self.SchedulePrerender()
+            self.LogEvent("update", time.monotonic())
+        elif command.finished:
+            print("OverlayWindow: no texts were loaded")
+            self.showing_placeholder = False
+            self.current_text = ""
+            self.CreateOverlayContent(self.current_text)
+
+    def OnTextsReplaced(self, command):
+        # stay at the same position, frames are cached by text so those of unchanged texts are reused
+        self.showing_placeholder = False
+        self.counter = max(min(self.counter, len(self.texts) - 1), 0)
+        self.current_text = self.texts[self.counter] if self.texts else ""
+        self.CreateOverlayContent(self.current_text)
+        self.SchedulePrerender()
+        self.LogEvent("update", time.monotonic())
+
+    def OnTextsChanged(self, command):
+        # keep showing the same entry, an entry inside the edited region maps to the same line of the new text.
+        # Frames are cached by text, so only texts that actually changed are rendered again
+        if len(self.texts) == command.added - command.removed:
+            self.counter = 0  # the file was empty, start at its first line
+        elif self.counter >= command.start + command.removed:
+            self.counter += command.added - command.removed
+        elif self.counter >= command.start:
+            self.counter = command.start + min(self.counter - command.start, max(command.added - 1, 0))
+        self.counter = max(min(self.counter, len(self.texts) - 1), 0)
+        self.showing_placeholder = False
+
+        text = self.texts[self.counter] if self.texts else ""
+        if text != self.current_text:
+            self.current_text = text
+            self.CreateOverlayContent(self.current_text)
+            self.LogEvent("update", time.monotonic())
+        self.SchedulePrerender()
+
+    def NextText(self):
+        event_time = time.monotonic()
+        if self.simultaneous_change:
+            if self.command_bus:
+                self.command_bus.Publish(commands.NextSlide())
+            else:
+                self.SimulateHotkey(self.simulated_hotkeys[HOTKEY_NEXTSLIDE])
+        self.UpdateCounterAndText(1)
+        self.LogEvent("next", event_time)
+        if self.create_log:
+            self.CreateLog(event_time)
+
+    def PreviousText(self):
+        event_time = time.monotonic()
+        if self.simultaneous_change:
+            if self.command_bus:
+                self.command_bus.Publish(commands.PrevSlide())
+            else:
+                self.SimulateHotkey(self.simulated_hotkeys[HOTKEY_PREVSLIDE])
+        self.UpdateCounterAndText(-1)
+        self.LogEvent("previous", event_time)
+        if self.create_log:
+            self.CreateLog(event_time)
+
+    def StartTimer(self):
+        self.starttime = datetime.datetime.now()
+        self.start_monotonic = time.monotonic()
+        self.LogEvent("start_timer", self.start_monotonic)
+        if self.create_log:
+            print("Starting log at", self.starttime)
+            self.CreateLog(self.start_monotonic)
 
     def ProcessMessages(self, hwnd, msg, wparam, lparam):
-        if msg == win32con.WM_HOTKEY:
-            if wparam == HOTKEY_HIDE:
-                self.HideOverlay()
-            elif wparam == HOTKEY_SHOW:
-                self.ShowOverlay()
-            elif wparam == HOTKEY_NEXTTEXT:
-                if self.simultaneous_change:
-                    self.SimulateHotkey(self.simulated_hotkeys[HOTKEY_NEXTSLIDE])
-                self.UpdateCounterAndText(1)
-                if self.create_log:
-                    self.CreateLog(datetime.datetime.now())
-            elif wparam == HOTKEY_PREVTEXT:
-                if self.simultaneous_change:
-                    self.SimulateHotkey(self.simulated_hotkeys[HOTKEY_PREVSLIDE])
-                self.UpdateCounterAndText(-1)
-                if self.create_log:
-                    self.CreateLog(datetime.datetime.now())
-            elif wparam == HOTKEY_STARTTIMER:
-                self.starttime = datetime.datetime.now()
-                if self.create_log:
-                    print("Starting log at", self.starttime)
-                    self.CreateLog(self.starttime)
-        elif msg == win32con.WM_DESTROY:
+        if msg == WM_HOTKEY:
+            metrics.registry.Increment("overlay.window_hotkeys")
+            self.dispatcher.DispatchHotkey(wparam)
+        elif msg == WM_DESTROY:
             print("OverlayWindow: WM_DESTROY received")
-            win32gui.PostQuitMessage(0)
+            self.dispatcher.Stop()
 
-        return win32gui.DefWindowProc(hwnd, msg, wparam, lparam)
+        return self.backend.DefWindowProc(hwnd, msg, wparam, lparam)
 
-    def CreateLog(self, endtime):
+    def CreateLog(self, event_time):
+        """Queue the log lines for the current text, event_time is the time.monotonic() of the hotkey."""
         if not self.create_log:
             return
 
-        try:
-            with open(self.log_path, "a") as fh:
-                timestamp = self.calc_time(endtime)
-                if timestamp != "0:00:00":
-                    try:
-                        fh.write("—" + timestamp + "\n")
-                    except Exception as e:
-                        print(f"Cannot write timestamp to file: {e}")
-                        self.create_log = False
-                        return
-
-                try:
-                    fh.write(self.current_text + ": " + timestamp + "\n")
-                except Exception as e:
-                    print(f"Cannot write text to file: {e}")
-                    self.create_log = False
-        except Exception as e:
-            print(f"Cannot open log file: {e}")
-            self.create_log = False
+        timestamp = self.calc_time(event_time)
+        lines = []
+        if timestamp != "0:00:00":
+            lines.append("—" + timestamp + "\n")
+        lines.append(self.current_text + ": " + timestamp + "\n")
+        self.session_logger.Log("".join(lines))
 
-    def calc_time(self, endtime):
-        td = endtime - self.starttime
-        total_seconds = int(td.total_seconds())
+    def LogEvent(self, event, event_time):
+        """Queue one structured log event for the text shown after it, event_time is a time.monotonic() value."""
+        if not self.event_logger:
+            return
+
+        index = None if self.showing_placeholder or not self.texts else self.counter
+        is_slide = self.texts_are_slides and index is not None
+        wall = self.starttime + datetime.timedelta(seconds=event_time - self.start_monotonic)
+        record = {
+            "session": self.session_id,
+            "event": event,
+            "index": index,
+            "text": self.current_text,
+            "slide": index if is_slide else None,
+            "section": get_section(self.current_text, self.section_names) if is_slide else None,
+            "monotonic": event_time,
+            "elapsed": event_time - self.start_monotonic,
+            "wall": wall.isoformat()
+        }
+        self.event_logger.Log(json.dumps(record) + "\n")
+
+    def calc_time(self, event_time):
+        total_seconds = int(event_time - self.start_monotonic)
         hours, remainder = divmod(total_seconds, 3600)
         minutes, seconds = divmod(remainder, 60)
 
@@ -171,21 +256,7 @@ class OverlayWindow:
 
     def RegisterHotkey(self, hotkey_id, keys):
         try:
-            modifiers = 0
-            vk = 0
-            for key in keys:
-                if key == "Shift":
-                    modifiers |= win32con.MOD_SHIFT
-                elif key == "Alt":
-                    modifiers |= win32con.MOD_ALT
-                elif key == "Ctrl":
-                    modifiers |= win32con.MOD_CONTROL
-                elif key == "Win":
-                    modifiers |= win32con.MOD_WIN
-                else:
-                    vk = ord(key.upper())  # Convert to uppercase for consistency
-
-            result = win32gui.RegisterHotKey(None, hotkey_id, modifiers, vk)
+            result = self.backend.RegisterHotkey(hotkey_id, keys)
             if not result:
                 print(f"Failed to register hotkey {hotkey_id} with keys {keys}")
             else:
@@ -198,7 +269,7 @@ class OverlayWindow:
         try:
             for hotkey in self.hotkey_list:
                 hotkey_id = hotkey[0]
-                result = win32gui.UnregisterHotKey(None, hotkey_id)
+                result = self.backend.UnregisterHotkey(hotkey_id)
                 if result:
                     print(f"Unregistered overlay hotkey {hotkey_id}")
                 else:
@@ -210,31 +281,15 @@ class OverlayWindow:
         if not keys:
             return
 
-        keys_to_press = []
-        for key in keys:
-            if key == "Ctrl":
-                keys_to_press.append(win32con.VK_CONTROL)
-            elif key == "Alt":
-                keys_to_press.append(win32con.VK_MENU)  # Alt key
-            elif key == "Shift":
-                keys_to_press.append(win32con.VK_SHIFT)
-            elif key == "Win":
-                keys_to_press.append(win32con.VK_LWIN)
-            else:
-                keys_to_press.append(ord(key.upper()))
-
-        # Press keys down
-        for key in keys_to_press:
-            win32api.keybd_event(key, 0, 0, 0)
-        # Release keys in reverse order
-        for key in reversed(keys_to_press):
-            win32api.keybd_event(key, 0, win32con.KEYEVENTF_KEYUP, 0)
+        self.backend.SendKeys(keys)
 
     def ShowWindow(self):
         if self.window:
-            win32gui.ShowWindow(self.window, win32con.SW_SHOWNORMAL)
+            self.backend.ShowWindow()
 
     def UpdateCounterAndText(self, amt):
+        if not self.texts:
+            return  # nothing loaded yet
         self.counter += amt
         if self.counter == -1:
             self.counter = 0  # can't go back from first text
@@ -243,62 +298,93 @@ class OverlayWindow:
         else:
             self.current_text = self.texts[self.counter]
             self.CreateOverlayContent(self.current_text)
-
-    def ConvertImageToBitmap(self, img):
-        hdc = win32gui.GetDC(0)
-        memdc = win32gui.CreateCompatibleDC(hdc)
-        width, height = img.size
-        raw_data = img.tobytes("raw", "BGRA")
-
-        bmi = BITMAPINFO()
-        bmi.bmiHeader.biSize = ctypes.sizeof(BITMAPINFOHEADER)
-        bmi.bmiHeader.biWidth = width
-        bmi.bmiHeader.biHeight = -height
-        bmi.bmiHeader.biPlanes = 1
-        bmi.bmiHeader.biBitCount = 32
-        bmi.bmiHeader.biCompression = win32con.BI_RGB
-        bmi.bmiHeader.biSizeImage = 0
-        bmi.bmiHeader.biXPelsPerMeter = 0
-        bmi.bmiHeader.biYPelsPerMeter = 0
-        bmi.bmiHeader.biClrUsed = 0
-        bmi.bmiHeader.biClrImportant = 0
-        ppvBits = ctypes.c_void_p()
-        hbitmap = ctypes.windll.gdi32.CreateDIBSection(
-            memdc, ctypes.byref(bmi), win32con.DIB_RGB_COLORS,
-            ctypes.byref(ppvBits), None, 0
-        )
-        if not hbitmap:
-            raise ctypes.WinError()
-
-        ctypes.memmove(ppvBits, raw_data, len(raw_data))
-
-        return hdc, memdc, hbitmap
+            self.SchedulePrerender()
+
+    def SchedulePrerender(self):
+        if self.prerender_worker:
+            self.prerender_worker.Schedule(self.texts, self.counter)
+
+    def GetFrameKey(self, text):
+        return FrameCache.MakeKey(text, self.font_path, self.font_size, self.text_color, (self.width, self.height))
+
+    def RasterizeFrame(self, text, previous=None):
+        """Render the frame for text, returns it and its dirty box relative to previous, see GetDirtyRect.
+
+        If previous has the same position and size, only the part of the mask that changed is recolored.
+        """
+        # recoloring with the channels swapped gives pixels in the BGRA order of the DIB section,
+        # so frames can be copied into it without any conversion
+        bgr_color = tuple(reversed(self.text_color))
+        with metrics.registry.Time("overlay.render"), profiling.trace_allocations("render"):
+            if self.tight_render:
+                mask, offset = create_text_image_mask_tight(self.height, text, self.font_path, self.font_size,
+                                                            use_atlas=self.glyph_atlas)
+            else:
+                mask = create_text_image_mask(self.width, self.height, text, self.font_path, self.font_size,
+                                              use_atlas=self.glyph_atlas)
+                offset = (0, 0)
+            if previous is not None and previous.offset == offset and previous.size == mask.size:
+                img, dirty = recolor_changed_region(mask, bgr_color, previous.image)
+            else:
+                img, dirty = recolor_image_with_alpha(mask, bgr_color), None
+        return RenderedFrame(img, offset), dirty
+
+    def RenderFrame(self, text, previous=None):
+        """Return the frame for text from the frame cache, rendering and caching it on a miss.
+
+        Also returns the dirty box of the frame relative to previous, see GetDirtyRect.
+        """
+        key = self.GetFrameKey(text)
+        frame = self.frame_cache.Get(key)
+        if frame is None:
+            metrics.registry.Increment("overlay.frame_cache_misses")
+            frame, dirty = self.RasterizeFrame(text, previous)
+            self.frame_cache.Put(key, frame)
+            return frame, dirty
+        return frame, self.GetDirtyRect(previous, frame)
+
+    def PrerenderFrame(self, text):
+        """Called from the prerender worker thread, does not count towards cache hits or misses."""
+        key = self.GetFrameKey(text)
+        if not self.frame_cache.Contains(key):
+            self.frame_cache.Put(key, self.RasterizeFrame(text)[0])
+
+    @staticmethod
+    def GetDirtyRect(previous, frame):
+        """(left, top, right, bottom) box in which frame differs from previous, in frame coordinates.
+
+        None if the whole frame has to be drawn because there is no previous frame or it has a different
+        position or size. The box is empty when the frames look the same.
+        """
+        if previous is None or previous.offset != frame.offset or previous.size != frame.size:
+            return None
+        if previous is frame:
+            return 0, 0, 0, 0
+        return get_changed_box(frame.image, previous.image)
+
+    def ConvertImageToBitmap(self, frame, dirty=None):
+        """Draw the frame into the persistent DIB section and return the memory DC holding it."""
+        with metrics.registry.Time("overlay.convert"):
+            return self.backend.surface.Draw(frame.image, dirty)
 
     def CreateOverlayContent(self, text):
         if not self.window:
             return
 
         try:
-            img = create_text_image(self.width, self.height, text, self.text_color, self.font_path, self.font_size)
-            hdc, memdc, hbitmap = self.ConvertImageToBitmap(img)
-            win32gui.SelectObject(memdc, hbitmap)
-            blend = (win32con.AC_SRC_OVER, 0, 255, win32con.AC_SRC_ALPHA)
-
-            win32gui.UpdateLayeredWindow(
-                self.window,
-                hdc,
-                (self.text_x_pos, self.text_y_pos),
-                (self.width, self.height),
-                memdc,
-                (0, 0),
-                0,
-                blend,
-                win32con.ULW_ALPHA
-            )
-
-            win32gui.ReleaseDC(self.window, hdc)
-            win32gui.DeleteObject(hbitmap)
-            win32gui.DeleteDC(memdc)
+            previous, self.presented_frame = self.presented_frame, None  # unknown until the update went through
+            frame, dirty = self.RenderFrame(text, previous)
+            if dirty is not None and dirty[0] >= dirty[2]:
+                self.presented_frame = frame  # looks the same as what is on screen
+                return
+            memdc = self.ConvertImageToBitmap(frame, dirty)
+            if dirty is not None:
+                metrics.registry.Increment("overlay.partial_updates")
+            with metrics.registry.Time("overlay.blit"):
+                self.backend.UpdateLayeredWindow(
+                    memdc, (self.text_x_pos + frame.offset[0], self.text_y_pos + frame.offset[1]), frame.size,
+                    dirty if self.backend.supports_dirty_rect else None)
+            self.presented_frame = frame
         except Exception as e:
             print(f"Error creating overlay content: {e}")
 
@@ -311,22 +397,12 @@ class OverlayWindow:
                 print(f"Registering overlay hotkey {hotkey_id}, {hotkey_keys}")
                 self.RegisterHotkey(hotkey_id, hotkey_keys)
 
-            # Message loop with timeout to check stop_event periodically
-            while not self.stop_event.is_set():
-                # Use PeekMessage with timeout instead of GetMessage to avoid blocking indefinitely
-                ret = win32gui.PeekMessage(None, 0, 0, win32con.PM_REMOVE)
-                if ret[0]:  # Message available
-                    msg = ret[1]
-                    if msg[1] == win32con.WM_QUIT:
-                        print("OverlayWindow: WM_QUIT received.")
-                        break
-                    self.ProcessMessages(None, msg[1], msg[2], msg[3])
-                    win32gui.TranslateMessage(msg)
-                    win32gui.DispatchMessage(msg)
-                else:
-                    # No message available, sleep briefly to avoid busy waiting
-                    import time
-                    time.sleep(0.01)  # 10ms sleep
+            for hotkey_id, handler in self.GetHotkeyHandlers().items():
+                self.dispatcher.RegisterHotkeyHandler(hotkey_id, handler)
+
+            # Blocks until a hotkey or command arrives, Stop() wakes it up immediately
+            if not self.stop_event.is_set():
+                self.dispatcher.Run()
 
         except KeyboardInterrupt:
             print("Keyboard interrupt received in overlay")
@@ -345,32 +421,37 @@ class OverlayWindow:
 
         # Set stop event to ensure any running loops exit
         self.stop_event.set()
+        self.dispatcher.Stop()
+
+        if self.prerender_worker:
+            self.prerender_worker.Stop()
+
+        # write out whatever is still queued before the process exits
+        if self.session_logger:
+            self.session_logger.Close()
+        if self.event_logger:
+            if self.start_monotonic is not None:
+                self.LogEvent("end", time.monotonic())
+            self.event_logger.Close()
 
         # Unregister hotkeys first
         self.UnregisterHotkeys()
 
         # Close and destroy the window
         try:
-            if self.window:
-                print("Hiding and destroying overlay window...")
-                self.HideOverlay()
-
-                # Destroy the window
-                result = win32gui.DestroyWindow(self.window)
-                if not result:
-                    print("Warning: Failed to destroy window")
-                self.window = None
-
+            self.backend.DestroyWindow()
+            self.window = None
         except Exception as e:
             print(f"Error destroying window: {e}")
 
+        try:
+            self.backend.ReleaseSurface()
+        except Exception as e:
+            print(f"Error releasing overlay bitmap: {e}")
+
         # Unregister the window class
         try:
-            if self.registered_class and self.h_instance:
-                result = win32gui.UnregisterClass(self.class_name, self.h_instance)
-                if not result:
-                    print("Warning: Failed to unregister window class")
-                self.registered_class = None
+            self.backend.UnregisterClass()
         except Exception as e:
             print(f"Error unregistering window class: {e}")
 
@@ -378,6 +459,9 @@ class OverlayWindow:
 
 
 if __name__ == "__main__":
+    import win32con
+    import win32api
+
     try:
         window = OverlayWindow(
             extended_style=win32con.WS_EX_LAYERED | win32con.WS_EX_TOPMOST | win32con.WS_EX_TOOLWINDOW,
@@ -0,0 +1,264 @@
+from ctypes import wintypes
+import ctypes
+from dib_surface import DIBSurface, Win32Gdi, BufferGdi
+from dispatcher import Win32MessageSource, QueueMessageSource, WM_HOTKEY
+from wintypestructs import BLENDFUNCTION, UPDATELAYEREDWINDOWINFO
+
+try:
+    import win32gui
+    import win32con
+    import win32api
+except ImportError:
+    win32gui = None  # only HeadlessBackend can be used
+
+if win32gui is not None:
+    # declared once on a handle of our own, ctypes.windll.user32 is shared with the rest of the process
+    _user32 = ctypes.WinDLL("user32", use_last_error=True)
+    _user32.UpdateLayeredWindowIndirect.argtypes = [wintypes.HWND, ctypes.POINTER(UPDATELAYEREDWINDOWINFO)]
+    _user32.UpdateLayeredWindowIndirect.restype = wintypes.BOOL
+
+WM_DESTROY = 0x0002  # same value as in win32con
+
+
+class Win32LayeredWindowBackend:
+    """Presents overlay frames in a layered Win32 window and receives hotkeys through the thread's message queue."""
+
+    # UpdateLayeredWindow can be given the part of the surface that changed since the last frame
+    supports_dirty_rect = True
+
+    def __init__(self, extended_style, class_name, window_name, style, x_pos, y_pos, width, height, parent_window,
+                 h_menu, lp_void):
+        self.extended_style = extended_style
+        self.class_name = class_name
+        self.window_name = window_name
+        self.style = style
+        self.x_pos = x_pos
+        self.y_pos = y_pos
+        self.width = width
+        self.height = height
+        self.parent_window = parent_window
+        self.h_menu = h_menu
+        self.h_instance = win32api.GetModuleHandle(None)
+        self.lp_void = lp_void
+
+        self.window = None
+        self.registered_class = None
+        # the DIB section frames are drawn into is kept for the whole session
+        self.surface = DIBSurface(Win32Gdi())
+
+    def CreateWindow(self, wnd_proc):
+        wndClass = win32gui.WNDCLASS()
+        wndClass.lpfnWndProc = wnd_proc
+        wndClass.hInstance = self.h_instance
+        wndClass.lpszClassName = self.class_name
+        wndClass.hCursor = win32gui.LoadCursor(0, win32con.IDC_ARROW)
+        self.registered_class = win32gui.RegisterClass(wndClass)
+
+        self.window = win32gui.CreateWindowEx(
+            self.extended_style,
+            self.registered_class,
+            self.window_name,
+            self.style,
+            self.x_pos,
+            self.y_pos,
+            self.width,
+            self.height,
+            self.parent_window,
+            self.h_menu,
+            self.h_instance,
+            self.lp_void
+        )
+        return self.window
+
+    def ShowWindow(self):
+        if self.window:
+            win32gui.ShowWindow(self.window, win32con.SW_SHOWNORMAL)
+
+    def Show(self):
+        if self.window:
+            win32gui.ShowWindow(self.window, win32con.SW_SHOW)
+
+    def Hide(self):
+        if self.window:
+            win32gui.ShowWindow(self.window, win32con.SW_HIDE)
+
+    def UpdateLayeredWindow(self, memdc, position, size, dirty=None):
+        if dirty is not None:
+            self.UpdateLayeredWindowIndirect(memdc, position, size, dirty)
+            return
+        blend = (win32con.AC_SRC_OVER, 0, 255, win32con.AC_SRC_ALPHA)
+        win32gui.UpdateLayeredWindow(
+            self.window,
+            None,
+            position,
+            size,
+            memdc,
+            (0, 0),
+            0,
+            blend,
+            win32con.ULW_ALPHA
+        )
+
+    def UpdateLayeredWindowIndirect(self, memdc, position, size, dirty):
+        """Only the dirty (left, top, right, bottom) box of the surface is copied, the window keeps the rest.
+
+        The window must already have the given position and size, pywin32 has no wrapper for this call.
+        """
+        destination = wintypes.POINT(*position)
+        window_size = wintypes.SIZE(*size)
+        source = wintypes.POINT(0, 0)
+        blend = BLENDFUNCTION(win32con.AC_SRC_OVER, 0, 255, win32con.AC_SRC_ALPHA)
+        dirty_rect = wintypes.RECT(*dirty)
+        info = UPDATELAYEREDWINDOWINFO(
+            ctypes.sizeof(UPDATELAYEREDWINDOWINFO),
+            None,
+            ctypes.pointer(destination),
+            ctypes.pointer(window_size),
+            int(memdc),
+            ctypes.pointer(source),
+            0,
+            ctypes.pointer(blend),
+            win32con.ULW_ALPHA,
+            ctypes.pointer(dirty_rect)
+        )
+        if not _user32.UpdateLayeredWindowIndirect(int(self.window), ctypes.byref(info)):
+            raise ctypes.WinError(ctypes.get_last_error())
+
+    def RegisterHotkey(self, hotkey_id, keys):
+        modifiers = 0
+        vk = 0
+        for key in keys:
+            if key == "Shift":
+                modifiers |= win32con.MOD_SHIFT
+            elif key == "Alt":
+                modifiers |= win32con.MOD_ALT
+            elif key == "Ctrl":
+                modifiers |= win32con.MOD_CONTROL
+            elif key == "Win":
+                modifiers |= win32con.MOD_WIN
+            else:
+                vk = ord(key.upper())  # Convert to uppercase for consistency
+        return win32gui.RegisterHotKey(None, hotkey_id, modifiers, vk)
+
+    def UnregisterHotkey(self, hotkey_id):
+        return win32gui.UnregisterHotKey(None, hotkey_id)
+
+    def SendKeys(self, keys):
+        keys_to_press = []
+        for key in keys:
+            if key == "Ctrl":
+                keys_to_press.append(win32con.VK_CONTROL)
+            elif key == "Alt":
+                keys_to_press.append(win32con.VK_MENU)  # Alt key
+            elif key == "Shift":
+                keys_to_press.append(win32con.VK_SHIFT)
+            elif key == "Win":
+                keys_to_press.append(win32con.VK_LWIN)
+            else:
+                keys_to_press.append(ord(key.upper()))
+
+        # Press keys down
+        for key in keys_to_press:
+            win32api.keybd_event(key, 0, 0, 0)
+        # Release keys in reverse order
+        for key in reversed(keys_to_press):
+            win32api.keybd_event(key, 0, win32con.KEYEVENTF_KEYUP, 0)
+
+    def CreateMessageSource(self):
+        return Win32MessageSource()
+
+    def DefWindowProc(self, hwnd, msg, wparam, lparam):
+        return win32gui.DefWindowProc(hwnd, msg, wparam, lparam)
+
+    def DestroyWindow(self):
+        if self.window:
+            print("Hiding and destroying overlay window...")
+            self.Hide()
+
+            # Destroy the window
+            result = win32gui.DestroyWindow(self.window)
+            if not result:
+                print("Warning: Failed to destroy window")
+            self.window = None
+
+    def ReleaseSurface(self):
+        self.surface.Release()
+
+    def UnregisterClass(self):
+        if self.registered_class and self.h_instance:
+            result = win32gui.UnregisterClass(self.class_name, self.h_instance)
+            if not result:
+                print("Warning: Failed to unregister window class")
+            self.registered_class = None
+
+
+class HeadlessBackend:
+    """In-memory stand-in for Win32LayeredWindowBackend, runs anywhere.
+
+    Every presented frame is recorded together with the window position, hotkeys are delivered with PostHotkey.
+    """
+
+    supports_dirty_rect = True
+
+    def __init__(self, width=0, height=0):
+        self.width = width
+        self.height = height
+        self.window = None
+        self.visible = False
+        self.surface = DIBSurface(BufferGdi())
+        self.message_source = QueueMessageSource()
+
+        self.frames = []  # (image, position) of every UpdateLayeredWindow call
+        self.positions = []
+        self.dirty_rects = []  # dirty box of every call, None when the whole frame was updated
+        self.hotkeys = {}
+        self.sent_keys = []
+
+    def CreateWindow(self, wnd_proc):
+        self.window = 1
+        return self.window
+
+    def ShowWindow(self):
+        self.Show()
+
+    def Show(self):
+        if self.window:
+            self.visible = True
+
+    def Hide(self):
+        if self.window:
+            self.visible = False
+
+    def UpdateLayeredWindow(self, memdc, position, size, dirty=None):
+        self.frames.append((self.surface.image.crop((0, 0) + tuple(size)), position))
+        self.positions.append(position)
+        self.dirty_rects.append(dirty)
+
+    def RegisterHotkey(self, hotkey_id, keys):
+        self.hotkeys[hotkey_id] = keys
+        return True
+
+    def UnregisterHotkey(self, hotkey_id):
+        return self.hotkeys.pop(hotkey_id, None) is not None
+
+    def SendKeys(self, keys):
+        self.sent_keys.append(keys)
+
+    def PostHotkey(self, hotkey_id):
+        self.message_source.Post(WM_HOTKEY, hotkey_id)
+
+    def CreateMessageSource(self):
+        return self.message_source
+
+    def DefWindowProc(self, hwnd, msg, wparam, lparam):
+        return 0
+
+    def DestroyWindow(self):
+        self.visible = False
+        self.window = None
+
+    def ReleaseSurface(self):
+        self.surface.Release()
+
+    def UnregisterClass(self):
+        pass
@@ -1,12 +1,11 @@
+import multiprocessing
 import wx
 from custom_controls import SaveFilePicker, FontPickerCtrl, NamedColourPicker, GlobalClickPicker, HotkeyCtrl
 import ctypes
 from hotkeys import *
 import json
 import threading
-import win32api
-import overlay
-import win32con
+import profiling
 
 try:
     ctypes.windll.shcore.SetProcessDpiAwareness(1)  # PROCESS_SYSTEM_DPI_AWARE
@@ -554,7 +553,11 @@ class MyFrame(wx.Frame):
             text_config = settings["text"]
 
             def overlay_thread_target():
+                # the overlay and win32 modules are only loaded once a preview is started
                 import pythoncom
+                import win32api
+                import win32con
+                import overlay
                 pythoncom.CoInitialize()
 
                 self.overlay_window = overlay.OverlayWindow(
@@ -581,7 +584,7 @@ class MyFrame(wx.Frame):
                 self.overlay_window.Run()
 
             self.overlay_thread = threading.Thread(
-                target=overlay_thread_target,
+                target=profiling.profile_thread("preview", overlay_thread_target),
                 daemon=True
             )
             self.overlay_thread.start()
@@ -599,9 +602,14 @@ class MyApp(wx.App):
 
 
 def main():
+    # the configuration tool has no settings of its own yet, profiling is turned on with OVERLAY_PROFILE
+    profiling.enable_from_environment()
     app = MyApp(False)
-    app.MainLoop()
+    profiling.profile_thread("configuration", app.MainLoop)()
+    profiling.write_reports()
 
 
 if __name__ == "__main__":
+    # the font scan starts worker processes, in the frozen exe they must not start the GUI again
+    multiprocessing.freeze_support()
     main()
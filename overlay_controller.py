@@ -1,5 +1,6 @@
 import overlay
 import pptcontroller
+import pptx_extractor
 import threading
 import json
 from hotkeys import *
@@ -8,6 +9,17 @@ import win32con
 import win32api
 import win32gui
 import sys
+import time
+from dispatcher import Dispatcher, Win32MessageSource
+from command_bus import CommandBus, TextsAppended, TextsReplaced, TextsChanged
+from title_cache import TitleCache
+from text_source import MappedTextSource
+import metrics
+import profiling
+
+TITLE_PUBLISH_INTERVAL = 0.1  # seconds between overlay updates while titles are streaming in
+TITLE_CACHE_PATH = "title_cache.json"
+TEXTS_POLL_INTERVAL = 0.5  # seconds between checks of the texts file for changes
 
 
 class OverlayController:
@@ -17,15 +29,24 @@ class OverlayController:
         self.additional_hotkeys_for_overlay = None
         self.additional_hotkeys_for_ppt = None
         self.stopped = False
+        self.text_source = None
+        self.section_names = []  # section names of the deck, shared with the overlay and PPTController
+        self.watch_stop_event = threading.Event()
+        # latency metrics are only collected when they are going to be written somewhere
+        self.metrics_path = self.general_config.get("metrics_path")
+        if self.metrics_path:
+            metrics.registry.Enable()
+        profiling.enable_from_environment(self.general_config.get("profile_dir"))
+        self.dispatcher = Dispatcher(Win32MessageSource(), "OverlayController")
+        # overlay and PowerPoint threads tell each other about slide and visibility changes through the bus
+        self.command_bus = CommandBus()
         self.Run()
 
     def stop(self):
         print("Shutting down...")
 
-        try:
-            win32gui.PostQuitMessage(0)  # Exit message loop
-        except Exception as e:
-            print("Error posting quit message:", e)
+        self.dispatcher.Stop()  # Exit message loop
+        self.watch_stop_event.set()
 
         for hotkey_id in [HOTKEY_QUIT, HOTKEY_STARTTIMER]:
             try:
@@ -56,6 +77,13 @@ class OverlayController:
 
                 if self.ppt_thread.is_alive():
                     print("Warning: PPT thread didn't stop cleanly")
+
+        if self.text_source:
+            self.text_source.Close()
+        print("Command bus stats:", self.command_bus.GetStats())
+        if self.metrics_path:
+            metrics.registry.DumpJson(self.metrics_path)
+        profiling.write_reports()
         print("Shutting down")
         sys.exit(0)
 
@@ -68,14 +96,18 @@ class OverlayController:
     def GetHotkeys(self):
         return [[HOTKEY_QUIT, self.general_config["hotkeys"][str(HOTKEY_QUIT)]]]
 
-    def ProcessMessages(self, hwnd, msg, wparam, lparam):
-        if msg == win32con.WM_HOTKEY:
-            if wparam == HOTKEY_QUIT:
-                print("quit")
-                self.stop()
-            elif wparam == HOTKEY_STARTTIMER:
-                print("Start timer")
-        return win32gui.DefWindowProc(hwnd, msg, wparam, lparam)
+    def GetHotkeyHandlers(self):
+        return {
+            HOTKEY_QUIT: self.OnQuit,
+            HOTKEY_STARTTIMER: self.OnStartTimer
+        }
+
+    def OnQuit(self):
+        print("quit")
+        self.stop()
+
+    def OnStartTimer(self):
+        print("Start timer")
 
     def RegisterHotkey(self, hotkey_id, keys):
         try:
@@ -100,11 +132,23 @@ class OverlayController:
             print(f"Error registering controller hotkey {hotkey_id} with keys {keys}: {e}")
 
     def GetTextsFromFile(self):
-        fh = open(self.general_config["texts_path"])
-        texts = fh.readlines()
-        texts = [x.strip() for x in texts]
-        fh.close()
-        return texts
+        # lines are decoded when they are shown, large caption files are never read into memory as a whole
+        self.text_source = MappedTextSource(self.general_config["texts_path"])
+        return self.text_source
+
+    def WatchTextsFile(self):
+        """Reload the texts file whenever it is saved, runs on its own thread until the controller stops."""
+        while not self.watch_stop_event.wait(TEXTS_POLL_INTERVAL):
+            if not self.text_source.HasChanged():
+                continue
+            try:
+                start, removed, added = self.text_source.Reload()
+            except (OSError, ValueError) as e:
+                print(f"Cannot reload texts file: {e}")
+                continue
+            if removed or added:
+                print(f"Texts file changed: {removed} texts from {start} on replaced by {added}")
+                self.command_bus.Publish(TextsChanged(start, removed, added))
 
     def RunOverlay(self):
         def overlay_thread_target():
@@ -118,31 +162,39 @@ class OverlayController:
                 [HOTKEY_STARTTIMER, self.general_config["hotkeys"][str(HOTKEY_STARTTIMER)]]
             ]
 
-            self.overlay_window = overlay.OverlayWindow(
-                extended_style=win32con.WS_EX_LAYERED | win32con.WS_EX_TOPMOST | win32con.WS_EX_TOOLWINDOW,
-                class_name="OverlayWindow",
-                window_name="OverlayWindow",
-                style=win32con.WS_POPUP,
-                x_pos=0,
-                y_pos=win32api.GetSystemMetrics(1) - 200,
-                width=win32api.GetSystemMetrics(0),
-                height=win32api.GetSystemMetrics(1),
-                parent_window=None,
-                h_menu=None,
-                lp_void=None,
-                text_settings=self.text_config,
-                texts=self.overlay_texts,
-                hotkey_list=overlay_hotkeys,
-                simultaneous_change=self.general_config["simultaneous_change"],
-                simulated_hotkeys=self.additional_hotkeys_for_overlay,
-                create_log=self.general_config["create_log"],
-                log_path=self.general_config["log_path"]
-            )
+            try:
+                self.overlay_window = overlay.OverlayWindow(
+                    extended_style=win32con.WS_EX_LAYERED | win32con.WS_EX_TOPMOST | win32con.WS_EX_TOOLWINDOW,
+                    class_name="OverlayWindow",
+                    window_name="OverlayWindow",
+                    style=win32con.WS_POPUP,
+                    x_pos=0,
+                    y_pos=win32api.GetSystemMetrics(1) - 200,
+                    width=win32api.GetSystemMetrics(0),
+                    height=win32api.GetSystemMetrics(1),
+                    parent_window=None,
+                    h_menu=None,
+                    lp_void=None,
+                    text_settings=self.text_config,
+                    texts=self.overlay_texts,
+                    hotkey_list=overlay_hotkeys,
+                    simultaneous_change=self.general_config["simultaneous_change"],
+                    simulated_hotkeys=self.additional_hotkeys_for_overlay,
+                    create_log=self.general_config["create_log"],
+                    log_path=self.general_config["log_path"],
+                    command_bus=self.command_bus,
+                    structured_log_path=self.general_config.get("structured_log_path"),
+                    texts_are_slides=self.general_config["use_ppt"],
+                    section_names=self.section_names
+                )
+                self.overlay_window.SubscribeCommands(self.command_bus)
+            finally:
+                self.overlay_ready_event.set()
 
             self.overlay_window.Run()
 
         self.overlay_thread = threading.Thread(
-            target=overlay_thread_target,
+            target=profiling.profile_thread("overlay", overlay_thread_target),
             daemon=False
         )
         self.overlay_thread.start()
@@ -158,17 +210,129 @@ class OverlayController:
                 [HOTKEY_PREVSLIDE, self.general_config["hotkeys"][str(HOTKEY_PREVSLIDE)]]
             ]
 
-            self.ppt_controller = pptcontroller.PPTController(self.ppt_config["ppt_path"], ppt_hotkey_list,
-                                                              self.general_config["toggle_overlay_with_ppt"],
-                                                              self.additional_hotkeys_for_ppt)
-            self.ppt_ready_event.set()
+            try:
+                self.ppt_controller = pptcontroller.PPTController(self.ppt_config["ppt_path"], ppt_hotkey_list,
+                                                                  self.general_config["toggle_overlay_with_ppt"],
+                                                                  self.additional_hotkeys_for_ppt, self.command_bus,
+                                                                  self.overlay_texts, self.section_names)
+                self.ppt_controller.SubscribeCommands(self.command_bus)
+            finally:
+                self.ppt_ready_event.set()
             self.ppt_controller.Run()
 
-        self.ppt_thread = threading.Thread(target=ppt_thread_target, daemon=False)
+        self.ppt_thread = threading.Thread(target=profiling.profile_thread("ppt", ppt_thread_target), daemon=False)
         self.ppt_thread.start()
 
+    def LoadPPTTitles(self, cached_titles, cache_fresh):
+        """Fill the text list shared by the overlay and PPTController with the slide titles.
+
+        Runs on its own thread while the overlay already shows the cached titles or its placeholder.
+        """
+        self.overlay_ready_event.wait()
+        ppt_path = self.ppt_config["ppt_path"]
+        if pptx_extractor.is_supported(ppt_path):
+            try:
+                self.section_names[:] = pptx_extractor.get_section_names(ppt_path)
+            except (pptx_extractor.PPTXExtractionError, OSError) as e:
+                print(f"Cannot read section names: {e}")
+        if cached_titles is not None:
+            self.command_bus.Publish(TextsAppended(len(cached_titles), finished=True))
+            if cache_fresh:
+                self.title_cache.Save()  # remember when the deck was last used
+            else:
+                self.RefreshCachedTitles(ppt_path, cached_titles)
+            return
+
+        if pptx_extractor.is_supported(ppt_path):
+            self.StreamPPTTitles(ppt_path)
+            if self.overlay_texts:
+                self.command_bus.Publish(TextsAppended(len(self.overlay_texts), finished=True))
+                return
+
+        # only PowerPoint can read this deck, which is slow, so its titles are cached like the extracted ones
+        try:
+            fingerprint = TitleCache.GetFingerprint(ppt_path)
+        except OSError as e:
+            print(f"Error reading slide titles: {e}")
+            fingerprint = None
+        titles = self.GetTitlesFromCOM()
+        self.overlay_texts.extend(titles)
+        self.command_bus.Publish(TextsAppended(len(self.overlay_texts), finished=True))
+        if titles and fingerprint is not None:
+            try:
+                self.StoreTitles(ppt_path, titles, fingerprint, TitleCache.HashFile(ppt_path))
+            except OSError as e:
+                print(f"Cannot cache slide titles: {e}")
+
+    def StreamPPTTitles(self, ppt_path):
+        """Append the titles as they are extracted, a complete list is stored in the title cache."""
+        last_publish = 0
+        try:
+            fingerprint = TitleCache.GetFingerprint(ppt_path)
+            for title in pptx_extractor.iter_sections_and_titles(ppt_path):
+                self.overlay_texts.append(title)
+                now = time.perf_counter()
+                if now - last_publish >= TITLE_PUBLISH_INTERVAL:
+                    self.command_bus.Publish(TextsAppended(len(self.overlay_texts)))
+                    last_publish = now
+            self.StoreTitles(ppt_path, list(self.overlay_texts), fingerprint, TitleCache.HashFile(ppt_path))
+        except (pptx_extractor.PPTXExtractionError, OSError) as e:
+            print(f"Error reading slide titles: {e}")
+
+    def RefreshCachedTitles(self, ppt_path, cached_titles):
+        """The deck changed on disk since its titles were cached, read it again and update the overlay if needed."""
+        try:
+            fingerprint = TitleCache.GetFingerprint(ppt_path)
+            content_hash = TitleCache.HashFile(ppt_path)
+            if self.title_cache.Revalidate(ppt_path, fingerprint, content_hash) is not None:
+                return  # same content, the file was only touched or copied
+            titles = None
+            if pptx_extractor.is_supported(ppt_path):
+                try:
+                    titles = pptx_extractor.get_sections_and_titles(ppt_path)
+                except pptx_extractor.PPTXExtractionError as e:
+                    print(f"{e}, reading titles through PowerPoint instead")
+            if titles is None:
+                titles = self.GetTitlesFromCOM()
+                if not titles:
+                    print("Error refreshing slide titles through PowerPoint, keeping the cached ones")
+                    return
+            self.StoreTitles(ppt_path, titles, fingerprint, content_hash)
+        except (pptx_extractor.PPTXExtractionError, OSError) as e:
+            print(f"Error refreshing slide titles, keeping the cached ones: {e}")
+            return
+
+        if titles != cached_titles:
+            print("Slide titles changed since they were cached, updating overlay")
+            self.overlay_texts[:] = titles
+            self.command_bus.Publish(TextsReplaced(len(titles)))
+
+    def GetTitlesFromCOM(self):
+        """Read the titles through PowerPoint on its own thread and wait for them, empty if that fails."""
+        self.ppt_ready_event.wait()
+        if not self.ppt_controller:
+            return []
+        titles = []
+        done = threading.Event()
+
+        def read_titles():
+            try:
+                titles.extend(self.ppt_controller.GetSectionsAndTitlesFromCOM())
+            finally:
+                done.set()
+
+        self.ppt_controller.dispatcher.Post(read_titles)
+        done.wait()
+        return titles
+
+    def StoreTitles(self, ppt_path, titles, fingerprint, content_hash):
+        # a deck that was saved again while it was being read, or hashed, is left for the next start to pick up
+        if TitleCache.GetFingerprint(ppt_path) == fingerprint:
+            self.title_cache.Put(ppt_path, titles, fingerprint, content_hash)
+
     def Run(self):
         # Run PPTController if configured,otherwise get texts from provided file
+        self.overlay_ready_event = threading.Event()
         if self.general_config["use_ppt"]:
             print("HERE")
             if self.general_config["toggle_overlay_with_ppt"]:
@@ -180,9 +344,13 @@ class OverlayController:
                 }
             self.ppt_controller = None
             self.ppt_ready_event = threading.Event()
+            # the overlay starts right away with the cached titles, otherwise they are appended to this list
+            # as they are read
+            self.title_cache = TitleCache(self.general_config.get("title_cache_path", TITLE_CACHE_PATH))
+            cached_titles, cache_fresh = self.title_cache.Get(self.ppt_config["ppt_path"])
+            self.overlay_texts = list(cached_titles) if cached_titles is not None else []
             self.RunPPTController()
-            self.ppt_ready_event.wait(timeout=5)  # wait max 5s
-            self.overlay_texts = self.ppt_controller.slides
+            threading.Thread(target=self.LoadPPTTitles, args=(cached_titles, cache_fresh), daemon=True).start()
             # If changing texts should change slides automatically, create configuration to pass to overlay
             if self.general_config["simultaneous_change"]:
                 self.additional_hotkeys_for_overlay = {
@@ -194,17 +362,16 @@ class OverlayController:
             self.overlay_texts = self.GetTextsFromFile()
             self.general_config["toggle_overlay_with_ppt"] = False
             self.general_config["simultaneous_change"] = False
+            if self.general_config.get("reload_texts", True):
+                threading.Thread(target=self.WatchTextsFile, daemon=True).start()
 
         self.RunOverlay()
         self.hotkey_list = self.GetHotkeys()
         for key in self.hotkey_list:
             self.RegisterHotkey(key[0], key[1])
-        while True:
-            ret, msg = win32gui.GetMessage(None, 0, 0)
-            if ret > 0:
-                self.ProcessMessages(None, msg[1], msg[2], msg[3])
-                win32gui.TranslateMessage(msg)
-                win32gui.DispatchMessage(msg)
+        for hotkey_id, handler in self.GetHotkeyHandlers().items():
+            self.dispatcher.RegisterHotkeyHandler(hotkey_id, handler)
+        self.dispatcher.Run()
 
 
 if __name__ == "__main__":
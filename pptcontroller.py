@@ -3,18 +3,28 @@ import win32con
 import win32gui
 import win32com.client
 from hotkeys import *
+from dispatcher import Dispatcher, Win32MessageSource
+import command_bus as commands
+import pptx_extractor
+import metrics
 import threading
 import atexit
 
 
 class PPTController:
-    def __init__(self, ppt_path, hotkey_list=None, toggle_overlay_with_ppt=False, simulated_hotkeys=None):
+    def __init__(self, ppt_path, hotkey_list=None, toggle_overlay_with_ppt=False, simulated_hotkeys=None,
+                 command_bus=None, slides=None, section_names=None):
         self.hotkey_list = hotkey_list or []
         self.toggle_overlay_with_ppt = toggle_overlay_with_ppt
         self.simulated_hotkeys = simulated_hotkeys
+        # overlay changes are sent over the command bus, simulated hotkeys are only used without one
+        self.command_bus = command_bus
         self.ppt_path = ppt_path
+        # filled with the deck's section names when the titles are read through PowerPoint
+        self.section_names = section_names if section_names is not None else []
 
         self.stop_event = threading.Event()
+        self.dispatcher = Dispatcher(Win32MessageSource(), "PPTController")
         self.ppt_app = None
         self.presentation = None
         self.window = None
@@ -26,7 +36,9 @@ class PPTController:
         try:
             self.OpenPPT()
             self.current_slide = 0
-            self.slides = self.GetSectionsAndTitles()
+            # a slide list passed in is shared with the overlay and may still be growing while titles are read,
+            # COM is then only used for navigation
+            self.slides = slides if slides is not None else self.GetSectionsAndTitles()
         except Exception as e:
             print(f"Error initializing PPTController: {e}")
             self._clean_up()
@@ -35,7 +47,7 @@ class PPTController:
     def Stop(self):
         print("PPTController: Stop signal received.")
         self.stop_event.set()
-        win32gui.PostQuitMessage(0)
+        self.dispatcher.Stop()  # wakes the message loop right away
 
     def OpenPPT(self):
         try:
@@ -48,15 +60,25 @@ class PPTController:
             raise
 
     def GetSectionsAndTitles(self):
+        if pptx_extractor.is_supported(self.ppt_path):
+            try:
+                return pptx_extractor.get_sections_and_titles(self.ppt_path)
+            except pptx_extractor.PPTXExtractionError as e:
+                print(f"{e}, reading titles through PowerPoint instead")
+        return self.GetSectionsAndTitlesFromCOM()
+
+    def GetSectionsAndTitlesFromCOM(self):
         if not self.presentation:
             return []
 
         try:
             section_props = self.presentation.SectionProperties
             result = []
+            names = []
 
             for i in range(section_props.Count):
                 section_name = section_props.Name(i + 1)
+                names.append(section_name)
                 first_slide = section_props.FirstSlide(i + 1)
                 num_slides = section_props.SlidesCount(i + 1)
 
@@ -75,6 +97,7 @@ class PPTController:
                     else:
                         result.append(f"{section_name}: {title}")
 
+            self.section_names[:] = names
             return result
         except Exception as e:
             print(f"Error getting sections and titles: {e}")
@@ -97,39 +120,66 @@ class PPTController:
             )
 
     def UpdateSlide(self, amt):
-        self.current_slide += amt
-        if self.current_slide == -1:
-            self.current_slide = 0  # can't go back from first text
-        elif self.current_slide == len(self.slides):
-            self.current_slide -= 1  # can't go forward from last text
-        else:
+        if not self.slides:
+            return  # titles are still loading, the overlay does not move either
+        # can't go back from the first text or forward from the last one, the list may also have shrunk
+        slide = max(min(self.current_slide + amt, len(self.slides) - 1), 0)
+        if slide != self.current_slide:
+            self.current_slide = slide
             self.MoveToSlide(self.current_slide)
 
+    def GotoSlide(self, number):
+        if 0 <= number < len(self.slides):
+            self.current_slide = number
+            self.MoveToSlide(number)
+
     def MoveToSlide(self, number):
         if self.presentation and self.ppt_app:
             try:
                 slide = self.presentation.Slides(number + 1)  # ppt is indexed from 1
                 view = self.ppt_app.ActiveWindow.View
-                view.GotoSlide(slide.SlideIndex)
+                with metrics.registry.Time("ppt.goto_slide"):
+                    view.GotoSlide(slide.SlideIndex)
             except Exception as e:
+                metrics.registry.Increment("ppt.goto_slide_errors")
                 print(f"Error moving to slide: {e}")
 
-    def ProcessMessages(self, hwnd, msg, wparam, lparam):
-        if msg == win32con.WM_HOTKEY:
-            if wparam == HOTKEY_SHOWPPT:
-                if self.toggle_overlay_with_ppt:
-                    self.SimulateHotkey(self.simulated_hotkeys[HOTKEY_HIDE])
-                self.ShowPPT()
-            elif wparam == HOTKEY_HIDEPPT:
-                if self.toggle_overlay_with_ppt:
-                    self.SimulateHotkey(self.simulated_hotkeys[HOTKEY_SHOW])
-                self.HidePPT()
-            elif wparam == HOTKEY_NEXTSLIDE:
-                print("Got Hotkey Next")
-                self.UpdateSlide(1)
-            elif wparam == HOTKEY_PREVSLIDE:
-                print("Got Hotkey Prev")
-                self.UpdateSlide(-1)
+    def GetHotkeyHandlers(self):
+        return {
+            HOTKEY_SHOWPPT: self.OnShowPPT,
+            HOTKEY_HIDEPPT: self.OnHidePPT,
+            HOTKEY_NEXTSLIDE: self.NextSlide,
+            HOTKEY_PREVSLIDE: self.PreviousSlide
+        }
+
+    def SubscribeCommands(self, bus):
+        bus.Subscribe(commands.NextSlide, self.dispatcher, lambda command: self.UpdateSlide(1))
+        bus.Subscribe(commands.PrevSlide, self.dispatcher, lambda command: self.UpdateSlide(-1))
+        bus.Subscribe(commands.GotoIndex, self.dispatcher, lambda command: self.GotoSlide(command.index))
+
+    def OnShowPPT(self):
+        if self.toggle_overlay_with_ppt:
+            if self.command_bus:
+                self.command_bus.Publish(commands.HideOverlay())
+            else:
+                self.SimulateHotkey(self.simulated_hotkeys[HOTKEY_HIDE])
+        self.ShowPPT()
+
+    def OnHidePPT(self):
+        if self.toggle_overlay_with_ppt:
+            if self.command_bus:
+                self.command_bus.Publish(commands.ShowOverlay())
+            else:
+                self.SimulateHotkey(self.simulated_hotkeys[HOTKEY_SHOW])
+        self.HidePPT()
+
+    def NextSlide(self):
+        print("Got Hotkey Next")
+        self.UpdateSlide(1)
+
+    def PreviousSlide(self):
+        print("Got Hotkey Prev")
+        self.UpdateSlide(-1)
 
     def RegisterHotkey(self, hotkey_id, keys):
         try:
@@ -196,20 +246,12 @@ class PPTController:
                 print(f"Registering {hotkey_id}, {hotkey_keys}")
                 self.RegisterHotkey(hotkey_id, hotkey_keys)
 
-            while not self.stop_event.is_set():
-                ret = win32gui.PeekMessage(None, 0, 0, win32con.PM_REMOVE)
-                if ret[0]:  # Message available
-                    msg = ret[1]
-                    if msg[1] == win32con.WM_QUIT:
-                        print("PPTController: WM_QUIT received.")
-                        break
-                    self.ProcessMessages(None, msg[1], msg[2], msg[3])
-                    win32gui.TranslateMessage(msg)
-                    win32gui.DispatchMessage(msg)
-                else:
-                    # No message available
-                    import time
-                    time.sleep(0.01)
+            for hotkey_id, handler in self.GetHotkeyHandlers().items():
+                self.dispatcher.RegisterHotkeyHandler(hotkey_id, handler)
+
+            # Blocks until a hotkey or command arrives, Stop() wakes it up immediately
+            if not self.stop_event.is_set():
+                self.dispatcher.Run()
 
         except KeyboardInterrupt:
             print("Keyboard interrupt received")
@@ -226,6 +268,7 @@ class PPTController:
         print("PPTController: Cleaning up PowerPoint.")
         self._cleaned_up = True
         self.stop_event.set()
+        self.dispatcher.Stop()
 
         # Unregister hotkeys first
         self.UnregisterHotkeys()
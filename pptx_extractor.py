@@ -0,0 +1,134 @@
+"""Reads section names and slide titles straight from a .pptx file, without starting PowerPoint.
+
+Produces the same "Section: Title" list as PPTController.GetSectionsAndTitles does through COM.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import posixpath
+import xml.etree.ElementTree as ET
+import zipfile
+
+NS = {
+    "p": "http://schemas.openxmlformats.org/presentationml/2006/main",
+    "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "p14": "http://schemas.microsoft.com/office/powerpoint/2010/main",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+}
+PRESENTATION_PART = "ppt/presentation.xml"
+PRESENTATION_RELS_PART = "ppt/_rels/presentation.xml.rels"
+SUPPORTED_EXTENSIONS = (".pptx", ".pptm", ".ppsx", ".ppsm", ".potx", ".potm")
+
+
+class PPTXExtractionError(Exception):
+    pass
+
+
+def is_supported(path):
+    return str(path).lower().endswith(SUPPORTED_EXTENSIONS)
+
+
+def get_section(text, section_names=()):
+    """Section name of an overlay text produced by get_sections_and_titles.
+
+    Section names and titles may both contain ": ", given the deck's section names (get_section_names) the
+    longest one the text starts with is used, otherwise the text is split at the first ": ".
+    """
+    section, _, title = text.partition(": ")
+    if section.startswith("Section ") and section[len("Section "):].isdigit():
+        return title  # the section's title slide
+    matches = [name for name in section_names if text.startswith(name + ": ")]
+    return max(matches, key=len) if matches else section
+
+
+def get_section_names(path):
+    """Names of the sections of a deck in presentation order, only presentation.xml is read."""
+    try:
+        with zipfile.ZipFile(path) as archive:
+            presentation = ET.fromstring(archive.read(PRESENTATION_PART))
+            return [section_name for section_name, _ in read_sections(presentation)]
+    except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+        raise PPTXExtractionError(f"Cannot read {path}: {e}") from e
+
+
+def get_sections_and_titles(path, workers=4):
+    return list(iter_sections_and_titles(path, workers))
+
+
+def iter_sections_and_titles(path, workers=4):
+    """Yield the overlay text of every slide in presentation order, slide parts are read and parsed in parallel.
+
+    Like the COM version, a presentation without sections gives no texts.
+    """
+    try:
+        with zipfile.ZipFile(path) as archive:
+            presentation = ET.fromstring(archive.read(PRESENTATION_PART))
+            slides = read_slide_list(archive, presentation)
+            sections = read_sections(presentation)
+            ordered = [(section_index, section_name, slides[slide_id])
+                       for section_index, (section_name, slide_ids) in enumerate(sections)
+                       for slide_id in slide_ids if slide_id in slides]
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # map keeps presentation order and still hands out results as soon as each one is ready
+                titles = executor.map(lambda entry: read_slide_title(archive, entry[2][1]), ordered)
+                for (section_index, section_name, (slide_number, _)), title in zip(ordered, titles):
+                    title = title or f"Untitled Slide {slide_number}"
+                    if title == section_name:
+                        yield f"Section {section_index}: {section_name}"
+                    else:
+                        yield f"{section_name}: {title}"
+    except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+        raise PPTXExtractionError(f"Cannot read {path}: {e}") from e
+
+
+def read_slide_list(archive, presentation):
+    """Map every slide id to its 1-based slide number and the name of its part in the archive."""
+    relationships = {}
+    for rel in ET.fromstring(archive.read(PRESENTATION_RELS_PART)).findall("rel:Relationship", NS):
+        relationships[rel.get("Id")] = resolve_part_name("ppt", rel.get("Target"))
+
+    slides = {}
+    for number, slide_id in enumerate(presentation.findall("p:sldIdLst/p:sldId", NS), 1):
+        slides[slide_id.get("id")] = (number, relationships[slide_id.get(f"{{{NS['r']}}}id")])
+    return slides
+
+
+def read_sections(presentation):
+    """Return (name, slide ids) of every section, sections are stored in an extension of presentation.xml."""
+    sections = []
+    for section in presentation.iter(f"{{{NS['p14']}}}section"):
+        slide_ids = [slide_id.get("id") for slide_id in section.findall("p14:sldIdLst/p14:sldId", NS)]
+        sections.append((section.get("name"), slide_ids))
+    return sections
+
+
+def resolve_part_name(base, target):
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(base, target))
+
+
+def read_slide_title(archive, part_name):
+    """Text of the first top level shape that has any, like iterating slide.Shapes through COM."""
+    tree = ET.fromstring(archive.read(part_name))
+    shape_tree = tree.find("p:cSld/p:spTree", NS)
+    if shape_tree is None:
+        return None
+    for shape in shape_tree.findall("p:sp", NS):
+        body = shape.find("p:txBody", NS)
+        if body is None:
+            continue
+        text = "\r".join(get_paragraph_text(paragraph) for paragraph in body.findall("a:p", NS))
+        if text:
+            return text.strip()
+    return None
+
+
+def get_paragraph_text(paragraph):
+    parts = []
+    for element in paragraph:
+        if element.tag in (f"{{{NS['a']}}}r", f"{{{NS['a']}}}fld"):
+            parts.append("".join(t.text or "" for t in element.findall("a:t", NS)))
+        elif element.tag == f"{{{NS['a']}}}br":
+            parts.append("\x0b")  # PowerPoint returns line breaks inside a paragraph as vertical tabs
+    return "".join(parts)
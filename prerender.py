@@ -0,0 +1,78 @@
+from collections import deque
+import threading
+
+
+class PrerenderWorker:
+    """Renders the texts around the current one on a background thread, so they are cached before they are shown.
+
+    After every counter change Schedule queues the neighbouring indices, more of them in the direction the
+    presenter keeps moving in. Work that was queued for an earlier position is dropped.
+    """
+
+    def __init__(self, prerender_function, lookahead=2, max_lookahead=8):
+        self.prerender_function = prerender_function  # renders the text and stores it in the frame cache
+        self.lookahead = lookahead
+        self.max_lookahead = max_lookahead
+
+        self.texts = None
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.stopped = False
+
+        self.last_counter = None
+        self.direction = 1
+        self.streak = 0
+
+        self.thread = threading.Thread(target=self.Run, daemon=True)
+        self.thread.start()
+
+    def Schedule(self, texts, counter):
+        step = 0 if self.last_counter is None else counter - self.last_counter
+        self.last_counter = counter
+        if step in (1, -1):
+            if step == self.direction:
+                self.streak += 1
+            else:
+                self.direction = step
+                self.streak = 1
+        else:
+            self.streak = 0  # a jump, no idea where the presenter goes next
+
+        ahead = min(self.lookahead + self.streak, self.max_lookahead)
+        behind = self.lookahead
+        indices = []
+        for distance in range(1, max(ahead, behind) + 1):
+            if distance <= ahead:
+                indices.append(counter + distance * self.direction)
+            if distance <= behind:
+                indices.append(counter - distance * self.direction)
+
+        with self.condition:
+            self.texts = texts
+            # replacing the queue cancels whatever was left over from the previous position
+            self.pending = deque(i for i in indices if 0 <= i < len(texts))
+            self.condition.notify()
+
+    def Stop(self):
+        with self.condition:
+            self.stopped = True
+            self.pending.clear()
+            self.condition.notify()
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+
+    def Run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                index = self.pending.popleft()
+                texts = self.texts
+
+            try:
+                if index < len(texts):
+                    self.prerender_function(texts[index])
+            except Exception as e:
+                print(f"Error prerendering text {index}: {e}")
@@ -0,0 +1,161 @@
+"""Opt-in profiling of the overlay tools, so a slow session can be sent in as a profile.
+
+Turned on by the OVERLAY_PROFILE environment variable or the general setting profile_dir, both name the directory
+the reports go to ("1" writes to ./profiles). When it is on:
+    - threads started through profile_thread run under cProfile, one <thread>.pstats and <thread>.txt each
+    - blocks wrapped in trace_allocations record how much traced memory they allocated and kept, and a
+      tracemalloc snapshot taken before the first of them is compared with one taken at exit, both go to
+      allocations.txt
+Reports are written by write_reports, or when the process exits.
+"""
+from contextlib import contextmanager, nullcontext
+import atexit
+import cProfile
+import io
+import os
+import pstats
+import threading
+import tracemalloc
+
+PROFILE_ENV = "OVERLAY_PROFILE"
+DEFAULT_PROFILE_DIR = "profiles"
+TRACE_FRAMES = 8
+REPORT_LINES = 40
+
+profiler = None
+
+
+class Profiler:
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.profiles = {}  # thread name -> cProfile.Profile
+        self.baseline = None  # tracemalloc snapshot from before the first traced block
+        self.traced_blocks = {}  # label -> [blocks, bytes kept, most bytes kept, largest peak]
+        self.lock = threading.Lock()
+        self.written = False
+        tracemalloc.start(TRACE_FRAMES)
+
+    def ProfileThread(self, name, function):
+        def run(*args, **kwargs):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError as e:
+                # since Python 3.12 only one profiler can be active at a time, the thread then runs unprofiled
+                print(f"Not profiling thread {name}: {e}")
+                return function(*args, **kwargs)
+            with self.lock:
+                thread_name = name
+                number = 1
+                while thread_name in self.profiles:  # the preview can start the same thread several times
+                    number += 1
+                    thread_name = f"{name}-{number}"
+                self.profiles[thread_name] = profile
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profile.disable()
+        return run
+
+    @contextmanager
+    def TraceAllocations(self, label):
+        # diffing full snapshots takes seconds, so every block only reads the traced memory and its peak.
+        # The peak is process wide, allocations of other threads during the block are included
+        if self.baseline is None:
+            with self.lock:
+                if self.baseline is None:
+                    self.baseline = tracemalloc.take_snapshot()
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            after, peak = tracemalloc.get_traced_memory()
+            with self.lock:
+                totals = self.traced_blocks.setdefault(label, [0, 0, 0, 0])
+                totals[0] += 1
+                totals[1] += after - before
+                totals[2] = max(totals[2], after - before)
+                totals[3] = max(totals[3], peak - before)
+
+    def WriteReports(self):
+        with self.lock:
+            if self.written:
+                return
+            self.written = True
+            profiles = dict(self.profiles)
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+        except OSError as e:
+            print(f"Cannot create profile directory {self.output_dir}: {e}")
+            return
+
+        self.WriteAllocationReport()  # before writing the profiles allocates memory of its own
+        for name, profile in profiles.items():
+            try:
+                profile.dump_stats(os.path.join(self.output_dir, f"{name}.pstats"))
+                summary = io.StringIO()
+                pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(REPORT_LINES)
+                with open(os.path.join(self.output_dir, f"{name}.txt"), "w") as fh:
+                    fh.write(summary.getvalue())
+            except Exception as e:  # a thread that is still running may not give complete stats
+                print(f"Cannot write profile of thread {name}: {e}")
+        print(f"Profiling reports written to {self.output_dir}")
+
+    def WriteAllocationReport(self):
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Traced memory: current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB", ""]
+        for label, (blocks, kept, most_kept, largest_peak) in sorted(self.traced_blocks.items()):
+            lines.append(f"{label}: {blocks} blocks, kept {kept / blocks / 1024:+.1f} KiB on average "
+                         f"(at most {most_kept / 1024:+.1f} KiB), largest peak {largest_peak / 1024:.1f} KiB")
+
+        if self.baseline is not None:
+            lines.append("")
+            lines.append("Memory growth since the first traced block, largest first:")
+            ignored = (tracemalloc.__file__, __file__)
+            differences = [stat for stat in tracemalloc.take_snapshot().compare_to(self.baseline, "lineno")
+                           if stat.traceback[0].filename not in ignored]
+            for stat in differences[:REPORT_LINES]:
+                lines.append(str(stat))
+        try:
+            with open(os.path.join(self.output_dir, "allocations.txt"), "w") as fh:
+                fh.write("\n".join(lines) + "\n")
+        except OSError as e:
+            print(f"Cannot write allocation report: {e}")
+
+
+def enable(output_dir):
+    global profiler
+    if profiler is None:
+        print(f"Profiling enabled, reports go to {output_dir}")
+        profiler = Profiler(output_dir)
+        atexit.register(write_reports)
+    return profiler
+
+
+def enable_from_environment(setting=None):
+    """Enable profiling if the environment variable or the given setting asks for it."""
+    output_dir = os.environ.get(PROFILE_ENV) or setting
+    if not output_dir:
+        return None
+    if str(output_dir).lower() in ("1", "true", "yes"):
+        output_dir = DEFAULT_PROFILE_DIR
+    return enable(output_dir)
+
+
+def profile_thread(name, function):
+    """Wrap a thread target so it runs under cProfile, returns it unchanged when profiling is off."""
+    if profiler is None:
+        return function
+    return profiler.ProfileThread(name, function)
+
+
+def trace_allocations(label):
+    if profiler is None:
+        return nullcontext()
+    return profiler.TraceAllocations(label)
+
+
+def write_reports():
+    if profiler is not None:
+        profiler.WriteReports()
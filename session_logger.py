@@ -0,0 +1,122 @@
+import os
+import queue
+import threading
+import time
+
+
+class SessionLogger:
+    """Appends log lines to a file from a background thread, so writing never delays a hotkey.
+
+    The file stays open for the whole session. Lines are queued by Log and written in batches, the file is
+    fsynced at most every fsync_interval seconds. A failed write is retried with the file reopened, lines are
+    only dropped when the queue is full or the write keeps failing.
+    """
+
+    def __init__(self, log_path, max_queue=1024, fsync_interval=1.0, retries=3, retry_delay=0.2):
+        self.log_path = log_path
+        self.fsync_interval = fsync_interval
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.fh = None
+        self.unsynced = False
+        self.last_fsync = time.monotonic()
+        self.dropped = 0
+        self.closed = False
+
+        self.thread = threading.Thread(target=self.Run, daemon=True)
+        self.thread.start()
+
+    def Log(self, line):
+        """Queue a line for writing, never blocks."""
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(line)
+        except queue.Full:
+            if not self.dropped:
+                print(f"Log queue full, dropping lines for {self.log_path}")
+            self.dropped += 1
+
+    def Close(self, timeout=2.0):
+        """Write everything that was queued and close the file."""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass  # the writer is stuck, the thread is a daemon and is left behind
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            print("Warning: log writer didn't finish in time")
+        if self.dropped:
+            print(f"Dropped {self.dropped} log lines")
+
+    def Run(self):
+        while True:
+            try:
+                line = self.queue.get(timeout=self.fsync_interval)
+            except queue.Empty:
+                self.Sync()
+                continue
+
+            # take whatever else is already queued and write it in one go
+            lines = []
+            finished = line is None
+            if not finished:
+                lines.append(line)
+            while not finished:
+                try:
+                    line = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if line is None:
+                    finished = True
+                else:
+                    lines.append(line)
+
+            if lines:
+                self.Write("".join(lines))
+            if finished:
+                self.Sync()
+                self.CloseFile()
+                return
+            if time.monotonic() - self.last_fsync >= self.fsync_interval:
+                self.Sync()
+
+    def Write(self, data):
+        for attempt in range(self.retries + 1):
+            try:
+                if self.fh is None:
+                    self.fh = open(self.log_path, "a")
+                self.fh.write(data)
+                self.fh.flush()
+                self.unsynced = True
+                return
+            except OSError as e:
+                print(f"Cannot write to log file {self.log_path} (attempt {attempt + 1}): {e}")
+                self.CloseFile()  # reopened on the next attempt
+                time.sleep(self.retry_delay * (attempt + 1))
+        self.dropped += data.count("\n")
+
+    def Sync(self):
+        if self.fh is None or not self.unsynced:
+            return
+        try:
+            self.fh.flush()
+            os.fsync(self.fh.fileno())
+            self.unsynced = False
+        except OSError as e:
+            print(f"Cannot sync log file {self.log_path}: {e}")
+            self.CloseFile()
+        self.last_fsync = time.monotonic()
+
+    def CloseFile(self):
+        if self.fh is not None:
+            try:
+                self.fh.close()
+            except OSError:
+                pass
+            self.fh = None
@@ -0,0 +1,211 @@
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+import locale
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # line breaks are searched with mmap.find instead
+
+INDEX_SUFFIX = ".lineidx"
+INDEX_MAGIC = b"LINEIDX2"
+INDEX_HEADER = struct.Struct("<8sQqQ")  # magic, file size, file mtime in ns, number of offsets
+RECENT_LINES = 256  # decoded lines kept to show in place of lines that moved before Reload ran
+
+
+class MappedTextSource:
+    """Read-only sequence of the stripped lines of a text file, like readlines() but without loading the file.
+
+    Only the start offset and a CRC32 of every line are kept in memory, a line is read and decoded when it is
+    accessed. The index is built over a memory map of the file and saved next to it, so it only has to be built
+    once. The file is not kept open, so it can still be saved by an editor while the overlay runs, Reload picks
+    up the changes.
+    """
+
+    def __init__(self, path, encoding=None):
+        self.path = path
+        # open() without an encoding uses the same one, so texts come out as they did with readlines()
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self.index_path = path + INDEX_SUFFIX
+        self.lock = threading.Lock()
+        self.offsets = array("Q", [0])
+        self.checksums = array("I")
+        self.fingerprint = None
+        self.recent_lines = OrderedDict()  # (fingerprint, index) -> text
+        self.Open()
+
+    @contextmanager
+    def Map(self):
+        """Map the current contents of the file, yields its stat result and data."""
+        with open(self.path, "rb") as fh:
+            stat = os.fstat(fh.fileno())
+            if not stat.st_size:
+                yield stat, b""  # empty files cannot be mapped
+                return
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield stat, data
+
+    def Open(self):
+        with open(self.path, "rb") as fh:
+            stat = os.fstat(fh.fileno())
+        index = self.LoadIndex(stat)
+        if index is None:
+            with self.Map() as (stat, data):
+                offsets = self.BuildIndex(data)
+                index = offsets, self.BuildChecksums(data, offsets)
+            self.SaveIndex(stat, *index)
+        self.offsets, self.checksums = index
+        self.fingerprint = (stat.st_size, stat.st_mtime_ns)
+
+    def Close(self):
+        pass  # nothing is held open between reads, kept so the source can be closed like a file
+
+    def HasChanged(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False  # an editor may be replacing the file, look again later
+        return (stat.st_size, stat.st_mtime_ns) != self.fingerprint
+
+    @staticmethod
+    def BuildIndex(data):
+        """Start offset of every line followed by the end of the data, a final line break does not start a line."""
+        size = len(data)
+        if not size:
+            return array("Q", [0])
+        if np is not None:
+            breaks = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 0x0A) + 1
+            offsets = array("Q", [0])
+            offsets.frombytes(breaks[breaks < size].astype(np.uint64).tobytes())
+        else:
+            offsets = array("Q", [0])
+            position = data.find(b"\n")
+            while position != -1 and position + 1 < size:
+                offsets.append(position + 1)
+                position = data.find(b"\n", position + 1)
+        offsets.append(size)
+        return offsets
+
+    @staticmethod
+    def BuildChecksums(data, offsets):
+        return array("I", (zlib.crc32(data[offsets[i]:offsets[i + 1]]) for i in range(len(offsets) - 1)))
+
+    def LoadIndex(self, stat):
+        try:
+            with open(self.index_path, "rb") as fh:
+                magic, size, mtime, count = INDEX_HEADER.unpack(fh.read(INDEX_HEADER.size))
+                if magic != INDEX_MAGIC or size != stat.st_size or mtime != stat.st_mtime_ns:
+                    return None  # written for another version of the file
+                offsets = array("Q")
+                offsets.frombytes(fh.read(count * offsets.itemsize))
+                checksums = array("I")
+                checksums.frombytes(fh.read((count - 1) * checksums.itemsize))
+        except (OSError, struct.error, ValueError):
+            return None
+        if len(offsets) != count or len(checksums) != count - 1:
+            return None
+        return offsets, checksums
+
+    def SaveIndex(self, stat, offsets, checksums):
+        try:
+            with open(self.index_path, "wb") as fh:
+                fh.write(INDEX_HEADER.pack(INDEX_MAGIC, stat.st_size, stat.st_mtime_ns, len(offsets)))
+                offsets.tofile(fh)
+                checksums.tofile(fh)
+        except OSError as e:
+            print(f"Cannot save line index {self.index_path}: {e}")
+
+    def Reload(self):
+        """Re-index the file after it changed, reading only the region that differs from the indexed version.
+
+        Lines at the start and end whose checksums still match are kept, only the lines in between are indexed
+        again. Returns (start, removed, added): the `removed` old lines from `start` on were replaced by `added`
+        new ones.
+        """
+        with self.Map() as (stat, data):
+            offsets, checksums = self.offsets, self.checksums
+            count = len(checksums)
+            old_size = offsets[-1]
+            new_size = len(data)
+
+            # unchanged lines at the start keep their offsets
+            start = 0
+            while start < count:
+                begin, end = offsets[start], offsets[start + 1]
+                if end > new_size or zlib.crc32(data[begin:end]) != checksums[start]:
+                    break
+                if end == old_size and end != new_size and data[end - 1] != 0x0A:
+                    break  # the last line had no line break and was continued
+                start += 1
+
+            # unchanged lines at the end are moved by the change in size
+            delta = new_size - old_size
+            end_count = 0
+            while end_count < count - start:
+                line = count - 1 - end_count
+                begin, end = offsets[line] + delta, offsets[line + 1] + delta
+                if begin < offsets[start] or zlib.crc32(data[begin:end]) != checksums[line]:
+                    break
+                if begin and data[begin - 1] != 0x0A:
+                    break  # not at the start of a line any more
+                end_count += 1
+
+            region_start = offsets[start]
+            region_end = offsets[count - end_count] + delta
+            region = data[region_start:region_end]
+            if region:
+                region_offsets = array("Q", (offset + region_start for offset in self.BuildIndex(region)))
+                region_checksums = self.BuildChecksums(data, region_offsets)
+                del region_offsets[-1]
+            else:
+                region_offsets, region_checksums = array("Q"), array("I")
+
+        new_offsets = offsets[:start] + region_offsets + array("Q", (offsets[line] + delta for line in
+                                                                     range(count - end_count, count + 1)))
+        new_checksums = checksums[:start] + region_checksums + checksums[count - end_count:]
+        with self.lock:
+            self.offsets, self.checksums = new_offsets, new_checksums
+            self.fingerprint = (stat.st_size, stat.st_mtime_ns)
+        self.SaveIndex(stat, new_offsets, new_checksums)
+        return start, count - start - end_count, len(region_checksums)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        with self.lock:
+            offsets, checksums, fingerprint = self.offsets, self.checksums, self.fingerprint
+        if index < 0:
+            index += len(offsets) - 1
+        if not 0 <= index < len(offsets) - 1:
+            raise IndexError("text index out of range")
+        key = (fingerprint, index)
+        try:
+            with open(self.path, "rb") as fh:
+                stat = os.fstat(fh.fileno())
+                fh.seek(offsets[index])
+                line = fh.read(offsets[index + 1] - offsets[index])
+        except OSError:
+            line = None  # an editor may be replacing the file
+        if line is None or ((stat.st_size, stat.st_mtime_ns) != fingerprint and
+                            zlib.crc32(line) != checksums[index]):
+            # the file was saved since it was indexed and the line is not where it was any more, show what it
+            # was until Reload catches up
+            with self.lock:
+                return self.recent_lines.get(key, "")
+
+        text = line.decode(self.encoding, errors="replace").strip()
+        with self.lock:
+            self.recent_lines[key] = text
+            self.recent_lines.move_to_end(key)
+            if len(self.recent_lines) > RECENT_LINES:
+                self.recent_lines.popitem(last=False)
+        return text
@@ -1,36 +1,190 @@
-from PIL import Image, ImageFont, ImageDraw
+from PIL import Image, ImageChops, ImageFont, ImageDraw
+import threading
 
-def create_text_image(width, height, text, text_color, font_path, font_size):
+try:
+    import numpy
+except ImportError:
+    numpy = None  # recoloring falls back to the pure Pillow kernel and texts are always drawn through FreeType
+
+from glyph_atlas import GlyphAtlas, needs_shaping
+
+
+TIGHT_MARGIN = 4  # pixels of transparent border kept around the ink box in tight render mode
+INK_LUT = [0] + [255] * 255  # FreeType leaves untouched pixels black and paints every inked one white
+
+# fonts and their line heights are loaded once per process and shared by all renders
+_font_cache = {}
+_line_height_cache = {}
+_atlas_cache = {}
+_default_font = None
+_atlas_unavailable_reported = False
+_font_cache_lock = threading.Lock()
+
+
+def create_text_image(width, height, text, text_color, font_path, font_size, use_atlas=True):
     """Create image with transparent background and opaque text in specified color and font."""
     print("Drawing")
-    img = create_text_image_mask(width, height, text, font_path, font_size)
+    img = create_text_image_mask(width, height, text, font_path, font_size, use_atlas)
     img = recolor_image_with_alpha(img, text_color)
     return img
 
 
-def create_text_image_mask(width, height, text, font_path, font_size):
+def load_font(font_path, font_size):
+    """Return the cached font for path and size, a path that failed to load keeps using the default font."""
+    key = (font_path, font_size)
+    font = _font_cache.get(key)
+    if font is None:
+        try:
+            font = ImageFont.truetype(font_path, font_size)
+        except IOError:
+            print(f"Cannot load font {font_path}, using default font")
+            font = load_default_font()
+        with _font_cache_lock:
+            font = _font_cache.setdefault(key, font)
+    return font
+
+
+def load_default_font():
+    global _default_font
+    if _default_font is None:
+        with _font_cache_lock:
+            if _default_font is None:
+                _default_font = ImageFont.load_default()
+    return _default_font
+
+
+def load_glyph_atlas(font_path, font_size):
+    """Return the cached glyph atlas for path and size, None if the font cannot be drawn from one."""
+    key = (font_path, font_size)
+    if key in _atlas_cache:
+        return _atlas_cache[key]
+    font = load_font(font_path, font_size)
+    atlas = None
+    # the atlas lays out text like the basic layout engine, fonts using Raqm and the bitmap default font
+    # keep being drawn through Pillow
+    if numpy is not None and getattr(font, "layout_engine", None) == ImageFont.Layout.BASIC:
+        atlas = GlyphAtlas(font)
+    with _font_cache_lock:
+        atlas = _atlas_cache.setdefault(key, atlas)
+    return atlas
+
+
+def get_text_atlas(font_path, font_size, text, use_atlas):
+    """Glyph atlas to draw text from, None if it has to go through FreeType."""
+    global _atlas_unavailable_reported
+    if not use_atlas or needs_shaping(text):
+        return None
+    if numpy is None:
+        if not _atlas_unavailable_reported:
+            _atlas_unavailable_reported = True
+            print("NumPy is not installed, drawing texts through FreeType instead of the glyph atlas")
+        return None
+    return load_glyph_atlas(font_path, font_size)
+
+
+def get_line_height(font_path, font_size):
+    key = (font_path, font_size)
+    line_height = _line_height_cache.get(key)
+    if line_height is None:
+        bbox = load_font(font_path, font_size).getbbox("Ag")
+        # Ag has both an ascender and a descender, measuring it instead of the text itself keeps words
+        # with no ascenders/descenders at the same height as other words
+        # otherwise text jumps around vertically and is ugly
+        line_height = bbox[3] - bbox[1]
+        _line_height_cache[key] = line_height
+    return line_height
+
+
+def get_text_position(font_path, font_size, height):
+    """Position of the text on a canvas of given height, the text sits near the bottom edge."""
+    x = 0
+    y = height - int(get_line_height(font_path, font_size)*1.5)
+    return x, y
+
+
+def mask_from_alpha(alpha):
+    """RGBA mask with the same bytes as FreeType text drawn in white, from the alpha drawn by the glyph atlas."""
+    ink = alpha.point(INK_LUT)
+    return Image.merge("RGBA", (ink, ink, ink, alpha))
+
+
+def create_text_image_mask(width, height, text, font_path, font_size, use_atlas=True):
     """This function creates a transparent image with fully opaque white text that can be recolored for the overlay."""
+    atlas = get_text_atlas(font_path, font_size, text, use_atlas)
     img = Image.new("RGBA", (width, height), (0, 0, 0, 0))  # create transparent image
+    if atlas is not None:
+        # only the text's box is composed, then pasted into the canvas which clips it
+        layout = atlas.Layout(text)
+        x, y = get_text_position(font_path, font_size, height)
+        left, top, right, bottom = layout.bbox
+        alpha = atlas.RenderMask(layout, (max(right - left, 1), max(bottom - top, 1)), (-left, -top))
+        img.paste(mask_from_alpha(alpha), (x + left, y + top))
+        return img
+
+    draw = ImageDraw.Draw(img)
+    font = load_font(font_path, font_size)
+    draw.text(get_text_position(font_path, font_size, height), text, font=font, fill=(255,255,255,255))
+    return img
+
+
+def create_text_image_mask_tight(height, text, font_path, font_size, margin=TIGHT_MARGIN, use_atlas=True):
+    """Mask of only the text's ink box plus margin, and the offset of that box in the full canvas."""
+    font = load_font(font_path, font_size)
+    x, y = get_text_position(font_path, font_size, height)
+    atlas = get_text_atlas(font_path, font_size, text, use_atlas)
+    layout = atlas.Layout(text) if atlas is not None else None
+    left, top, right, bottom = layout.bbox if layout is not None else font.getbbox(text)
+    offset = (x + left - margin, y + top - margin)
+    size = (max(right - left + 2 * margin, 1), max(bottom - top + 2 * margin, 1))
+
+    if layout is not None:
+        alpha = atlas.RenderMask(layout, size, (x - offset[0], y - offset[1]))
+        return mask_from_alpha(alpha), offset
+
+    img = Image.new("RGBA", size, (0, 0, 0, 0))
     draw = ImageDraw.Draw(img)
+    draw.text((x - offset[0], y - offset[1]), text, font=font, fill=(255,255,255,255))
+    return img, offset
 
-    try:
-        font = ImageFont.truetype(font_path, font_size)
-    except IOError:
-        font = ImageFont.load_default()
 
-    x = 0
-    bbox = draw.textbbox((0, 0), text + "Ag", font=font)
-    # in line above Ag is added cause otherwise words with no ascenders/descenders would be positioned
-    # at a different height as their bounding box is smaller that words with ascenders/descenders
-    # this causes text to jump around vertically and is ugly
-    text_height = bbox[3] - bbox[1]
-    y = height - int(text_height*1.5)
-    draw.text((x, y), text, font=font, fill=(255,255,255,255))
-    return img
+def recolor_image_with_alpha(img, rgb_color, kernel=None):
+    """This function creates an image with premultiplied alpha based on an image mask.
+
+    kernel names one of RECOLOR_KERNELS; by default the fastest one available is used.
+    All kernels give byte-identical results, so the returned image must be used instead of img.
+    """
+    return RECOLOR_KERNELS[kernel or default_recolor_kernel()](img, rgb_color)
+
+
+def recolor_changed_region(img, rgb_color, previous):
+    """Recolor a mask reusing previous, the recolored image of an earlier mask with the same size and color.
+
+    Only the box around the pixels whose alpha changed is recolored. Returns the image and that
+    (left, top, right, bottom) box, the box is empty when nothing changed.
+    """
+    dirty = get_changed_box(img, previous)
+    recolored = previous.copy()
+    if dirty[0] < dirty[2]:
+        recolored.paste(recolor_image_with_alpha(img.crop(dirty), rgb_color), dirty[:2])
+    return recolored, dirty
+
 
+def get_changed_box(img, previous):
+    """Bounding box of the pixels whose alpha differs between two images of the same size, empty if none do."""
+    return ImageChops.difference(img.getchannel("A"), previous.getchannel("A")).getbbox() or (0, 0, 0, 0)
 
-def recolor_image_with_alpha(img, rgb_color):
-    """This function creates an image with premultiplied alpha based on an image mask."""
+
+def default_recolor_kernel():
+    return "numpy" if numpy is not None else "pillow"
+
+
+def alpha_lut(channel_value):
+    """Premultiplied value of a color channel for every possible alpha, rounded like the reference kernel."""
+    return [int(channel_value * (alpha / 255)) for alpha in range(256)]
+
+
+def recolor_reference(img, rgb_color):
+    """Per-pixel kernel, kept as the reference the faster kernels are checked against."""
     r, g, b = rgb_color # color that the mask should be recolored to
     pixels = img.load()
 
@@ -45,3 +199,31 @@ def recolor_image_with_alpha(img, rgb_color):
             premultiplied_blue = int(b * alpha_factor)
             pixels[x, y] = (premultiplied_red, premultiplied_green, premultiplied_blue, alpha)
     return img
+
+
+def recolor_pillow(img, rgb_color):
+    """Band based kernel: every color band is the alpha band mapped through a 256 entry lookup table."""
+    alpha = img.getchannel("A")
+    recolored = Image.merge("RGBA", [alpha.point(alpha_lut(c)) for c in rgb_color] + [alpha])
+    # fully transparent pixels keep their original color, same as in the reference kernel
+    coverage = alpha.point([0] + [255] * 255)
+    return Image.composite(recolored, img, coverage)
+
+
+def recolor_numpy(img, rgb_color):
+    """Array based kernel: the whole alpha plane is premultiplied in one lookup per color band."""
+    pixels = numpy.asarray(img)
+    alpha = pixels[..., 3]
+    transparent = alpha == 0
+    result = pixels.copy()
+    for band, c in enumerate(rgb_color):
+        lut = numpy.array(alpha_lut(c), dtype=numpy.uint8)
+        result[..., band] = numpy.where(transparent, pixels[..., band], lut[alpha])
+    return Image.fromarray(result)
+
+
+RECOLOR_KERNELS = {
+    "reference": recolor_reference,
+    "pillow": recolor_pillow,
+    "numpy": recolor_numpy,
+}
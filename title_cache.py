@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class TitleCache:
+    """Slide titles of previously opened decks, stored in a JSON file so restarts don't have to read the deck again.
+
+    Entries are keyed by the deck's absolute path and remember its size, mtime and content hash. Only the
+    max_entries most recently used decks are kept.
+    """
+
+    def __init__(self, cache_path, max_entries=32):
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = self.Load()
+
+    @staticmethod
+    def GetFingerprint(ppt_path):
+        stat = os.stat(ppt_path)
+        return stat.st_size, stat.st_mtime_ns
+
+    @staticmethod
+    def HashFile(ppt_path):
+        digest = hashlib.sha256()
+        with open(ppt_path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def Load(self):
+        try:
+            with open(self.cache_path, encoding="utf-8") as fh:
+                entries = json.load(fh)
+            return entries if isinstance(entries, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Cannot read title cache {self.cache_path}, starting with an empty one: {e}")
+            return {}
+
+    def Save(self):
+        with self.lock:
+            data = json.dumps(self.entries, ensure_ascii=False)
+        # write to a temporary file first so an interrupted save never leaves a broken cache behind
+        temp_path = self.cache_path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as fh:
+                fh.write(data)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            print(f"Cannot write title cache {self.cache_path}: {e}")
+
+    def Get(self, ppt_path):
+        """Return (titles, fresh) for the deck, titles is None when it was never cached.
+
+        fresh is False when the deck's size or mtime changed since it was cached, the titles may then be outdated.
+        """
+        key = os.path.abspath(ppt_path)
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return None, False
+        try:
+            fresh = tuple(entry["fingerprint"]) == self.GetFingerprint(ppt_path)
+        except OSError:
+            fresh = False
+        if fresh:
+            self.Touch(key)
+        return entry["titles"], fresh
+
+    def Revalidate(self, ppt_path, fingerprint, content_hash):
+        """Compare the content hash of a deck whose size or mtime changed with the cached one.
+
+        Returns the cached titles when the content is the same (the file was only touched or copied), else None.
+        """
+        key = os.path.abspath(ppt_path)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry["hash"] != content_hash:
+                return None
+            entry["fingerprint"] = list(fingerprint)
+            entry["last_used"] = time.time()
+        self.Save()
+        return entry["titles"]
+
+    def Put(self, ppt_path, titles, fingerprint, content_hash):
+        key = os.path.abspath(ppt_path)
+        entry = {
+            "fingerprint": list(fingerprint),
+            "hash": content_hash,
+            "titles": list(titles),
+            "last_used": time.time()
+        }
+        with self.lock:
+            self.entries[key] = entry
+            self.Evict()
+        self.Save()
+
+    def Touch(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries[key]["last_used"] = time.time()
+
+    def Evict(self):
+        # least recently used decks go first
+        while len(self.entries) > self.max_entries:
+            oldest = min(self.entries, key=lambda k: self.entries[k]["last_used"])
+            del self.entries[oldest]
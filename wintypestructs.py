@@ -1,4 +1,4 @@
-from ctypes import wintypes, Structure
+from ctypes import wintypes, Structure, POINTER, c_ubyte
 
 
 class BITMAPINFOHEADER(Structure):
@@ -22,3 +22,27 @@ class BITMAPINFO(Structure):
         ('bmiHeader', BITMAPINFOHEADER),
         ('bmiColors', wintypes.DWORD * 3)  # dummy, unused for 32bpp
     ]
+
+
+class BLENDFUNCTION(Structure):
+    _fields_ = [
+        ('BlendOp', c_ubyte),
+        ('BlendFlags', c_ubyte),
+        ('SourceConstantAlpha', c_ubyte),
+        ('AlphaFormat', c_ubyte),
+    ]
+
+
+class UPDATELAYEREDWINDOWINFO(Structure):
+    _fields_ = [
+        ('cbSize', wintypes.DWORD),
+        ('hdcDst', wintypes.HDC),
+        ('pptDst', POINTER(wintypes.POINT)),
+        ('psize', POINTER(wintypes.SIZE)),
+        ('hdcSrc', wintypes.HDC),
+        ('pptSrc', POINTER(wintypes.POINT)),
+        ('crKey', wintypes.COLORREF),
+        ('pblend', POINTER(BLENDFUNCTION)),
+        ('dwFlags', wintypes.DWORD),
+        ('prcDirty', POINTER(wintypes.RECT)),
+    ]